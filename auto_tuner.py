@@ -0,0 +1,274 @@
+import argparse
+import json
+import os
+import socket
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import torch
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+from multiscale import set_detection_scale
+
+TUNING_PATH = "tuning.json"
+
+
+def make_sample_frame(width=1920, height=1080):
+    """Синтетический кадр с номерной табличкой для прогрева детектора и OCR"""
+    frame = np.full((height, width, 3), 90, dtype=np.uint8)
+    cv2.rectangle(frame, (width // 2 - 260, height // 2 - 60),
+                  (width // 2 + 260, height // 2 + 60), (255, 255, 255), -1)
+    cv2.rectangle(frame, (width // 2 - 260, height // 2 - 60),
+                  (width // 2 + 260, height // 2 + 60), (0, 0, 0), 4)
+    cv2.putText(frame, "A 123 BC 77", (width // 2 - 240, height // 2 + 30),
+                cv2.FONT_HERSHEY_SIMPLEX, 2.6, (0, 0, 0), 7)
+    return frame
+
+
+class SampleInput:
+    """Готовит вход пайплайна: путь к файлу (image_loader="opencv") или кадр RGB (image_loader=None)"""
+
+    def __init__(self, sample_path=None, uses_paths=True):
+        self.uses_paths = uses_paths
+        self.temp_path = None
+        frame = cv2.imread(sample_path) if sample_path else None
+        if frame is None:
+            frame = make_sample_frame()
+        if uses_paths:
+            if sample_path and os.path.exists(sample_path):
+                self.item = sample_path
+            else:
+                fd, self.temp_path = tempfile.mkstemp(suffix=".jpg")
+                os.close(fd)
+                cv2.imwrite(self.temp_path, frame)
+                self.item = self.temp_path
+        else:
+            self.item = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def batch(self, size):
+        return [self.item] * size
+
+    def close(self):
+        if self.temp_path and os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+def host_key():
+    return socket.gethostname()
+
+
+def load_tuning(path=TUNING_PATH):
+    """Возвращает сохраненную конфигурацию для текущего компьютера или None"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f).get(host_key())
+    except (OSError, ValueError):
+        return None
+
+
+def save_tuning(config, path=TUNING_PATH):
+    """Сохраняет конфигурацию, не трогая записи других компьютеров
+
+    Файл заменяется атомарно: читающий процесс не увидит недописанный JSON.
+    """
+    data = {}
+    if os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+    data[host_key()] = config
+    part_path = f"{path}.{os.getpid()}.part"
+    with open(part_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(part_path, path)
+
+
+class TuningLock:
+    """Межпроцессная блокировка: подбор на компьютере выполняет один процесс, остальные ждут его результата"""
+
+    def __init__(self, path=TUNING_PATH):
+        self.lock_path = path + ".lock"
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.lock_path, "a+")
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            return self
+        while True:
+            try:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                return self
+            except OSError:
+                # LK_LOCK сдается после 10 секунд ожидания, а подбор идет дольше
+                continue
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+        self.file = None
+
+
+def apply_tuning(config):
+    """Применяет число потоков torch и OpenCV"""
+    torch.set_num_threads(int(config['torch_threads']))
+    cv2.setNumThreads(int(config['cv2_threads']))
+
+
+def warm_up(number_plate_detection_and_reading, sample, runs=2, batch_size=1):
+    """Прогревочные вызовы: ленивая инициализация происходит до первого реального кадра"""
+    start_time = time.perf_counter()
+    for _ in range(runs):
+        number_plate_detection_and_reading(sample.batch(batch_size))
+    return time.perf_counter() - start_time
+
+
+def count_sample_plates(number_plate_detection_and_reading, sample):
+    """Число прочитанных номеров на образце: без них OCR не прогревается и не измеряется"""
+    from nomeroff_net.tools import unzip
+
+    texts = unzip(number_plate_detection_and_reading(sample.batch(1)))[-1]
+    return sum(1 for image_texts in texts for text in image_texts if text)
+
+
+def measure(number_plate_detection_and_reading, sample, batch_size, repeats):
+    """Среднее время обработки одного кадра при заданном размере пакета"""
+    number_plate_detection_and_reading(sample.batch(batch_size))
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        number_plate_detection_and_reading(sample.batch(batch_size))
+    return (time.perf_counter() - start_time) / (repeats * batch_size)
+
+
+def candidate_threads(cpu_count):
+    return sorted({1, 2, 4, max(cpu_count // 2, 1), cpu_count} - {0})
+
+
+def default_config():
+    """Текущие настройки процесса: потоки по умолчанию, пакет из одного кадра"""
+    return {'torch_threads': torch.get_num_threads(), 'cv2_threads': cv2.getNumThreads(),
+            'batch_size': 1}
+
+
+def tune(number_plate_detection_and_reading, sample, repeats=3, batch_sizes=(1, 2, 4, 8)):
+    """Подбирает число потоков и размер пакета на текущем компьютере
+
+    Параметры перебираются по очереди (потоки torch, потоки OpenCV, размер пакета),
+    при переборе одного параметра остальные берутся лучшими из найденных.
+    """
+    cpu_count = os.cpu_count() or 1
+    config = default_config()
+
+    print("Прогрев моделей...")
+    warm_up(number_plate_detection_and_reading, sample)
+
+    best_time = None
+    for threads in [t for t in candidate_threads(cpu_count) if t <= cpu_count]:
+        torch.set_num_threads(threads)
+        frame_time = measure(number_plate_detection_and_reading, sample, 1, repeats)
+        print(f"Потоков torch: {threads:2d} | {frame_time * 1000:.1f} мс/кадр")
+        if best_time is None or frame_time < best_time:
+            best_time, config['torch_threads'] = frame_time, threads
+    torch.set_num_threads(config['torch_threads'])
+
+    best_time = None
+    for threads in sorted({1, max(cpu_count // 2, 1), cpu_count}):
+        cv2.setNumThreads(threads)
+        frame_time = measure(number_plate_detection_and_reading, sample, 1, repeats)
+        print(f"Потоков OpenCV: {threads:2d} | {frame_time * 1000:.1f} мс/кадр")
+        if best_time is None or frame_time < best_time:
+            best_time, config['cv2_threads'] = frame_time, threads
+    cv2.setNumThreads(config['cv2_threads'])
+
+    best_time = None
+    for batch_size in batch_sizes:
+        frame_time = measure(number_plate_detection_and_reading, sample, batch_size, repeats)
+        print(f"Размер пакета: {batch_size:2d} | {frame_time * 1000:.1f} мс/кадр")
+        # Больший пакет увеличивает задержку, поэтому берем его только при заметном выигрыше
+        if best_time is None or frame_time < best_time * 0.9:
+            best_time, config['batch_size'] = frame_time, batch_size
+
+    config.update({
+        'frame_ms': best_time * 1000,
+        'cpu_count': cpu_count,
+        'tuned_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    return config
+
+
+def load_or_tune(number_plate_detection_and_reading, uses_paths=True, force=False,
+                 sample_path=None, path=TUNING_PATH):
+    """Применяет сохраненную конфигурацию (или подбирает ее при первом запуске) и прогревает модели
+
+    Масштаб детекции (set_detection_scale) должен быть применен до вызова, чтобы
+    замеры шли на той же нагрузке, что и работа. Подбор требует образца, на котором
+    пайплайн читает номер; иначе замеры не включали бы OCR, поэтому подбор
+    пропускается и используются настройки по умолчанию (без сохранения).
+    """
+    sample = SampleInput(sample_path, uses_paths)
+    try:
+        plates = count_sample_plates(number_plate_detection_and_reading, sample)
+        # Обработчики на одном компьютере стартуют одновременно: подбирает первый,
+        # остальные ждут и берут его конфигурацию, не мешая замерам
+        with TuningLock(path):
+            config = None if force else load_tuning(path)
+            if config is None:
+                if not plates:
+                    print("Предупреждение: на образце не найден номер, подбор пропущен, используются "
+                          "настройки по умолчанию. Для подбора укажите кадр с номером "
+                          "(python auto_tuner.py --sample <файл>)")
+                    config = default_config()
+                else:
+                    print("Подбор параметров производительности для этого компьютера...")
+                    config = tune(number_plate_detection_and_reading, sample)
+                    save_tuning(config, path)
+                    print(f"Конфигурация сохранена в {path}: {config}")
+        if not plates:
+            print("Предупреждение: на образце не найден номер, OCR не прогрет")
+
+        apply_tuning(config)
+        warm_up_time = warm_up(number_plate_detection_and_reading, sample,
+                               runs=1, batch_size=config['batch_size'])
+        print(f"Потоков torch: {config['torch_threads']}, OpenCV: {config['cv2_threads']}, "
+              f"пакет: {config['batch_size']} | прогрев: {warm_up_time:.2f} секунд")
+        return config
+    finally:
+        sample.close()
+
+
+if __name__ == "__main__":
+    from nomeroff_net import pipeline
+
+    parser = argparse.ArgumentParser(description="Подбор потоков и размера пакета для распознавания")
+    parser.add_argument("--force", action="store_true", help="Подобрать заново, даже если конфигурация есть")
+    parser.add_argument("--sample", default=None, help="Изображение с номером для замеров")
+    parser.add_argument("--path", default=TUNING_PATH)
+    parser.add_argument("--detection-scale", type=float, default=1.0,
+                        help="Масштаб кадра для детектора, как при работе")
+    args = parser.parse_args()
+
+    print("Инициализация системы распознавания...")
+    number_plate_detection_and_reading = pipeline(
+        "number_plate_detection_and_reading",
+        image_loader="opencv"
+    )
+    set_detection_scale(number_plate_detection_and_reading, args.detection_scale)
+    load_or_tune(number_plate_detection_and_reading, uses_paths=True, force=args.force,
+                 sample_path=args.sample, path=args.path)
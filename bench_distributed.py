@@ -0,0 +1,26 @@
+import argparse
+import os
+import tempfile
+
+from distributed_processing import run_coordinator
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Суммарная скорость обработки архива несколькими обработчиками")
+    parser.add_argument("videos", nargs="+", help="Видео для обработки")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--job-seconds", type=float, default=20.0)
+    args = parser.parse_args()
+
+    baseline = None
+    for workers in args.workers:
+        print(f"\n=== Обработчиков: {workers} ===")
+        # Каждый прогон с чистой очередью и историей, чтобы результаты не смешивались
+        with tempfile.TemporaryDirectory() as directory:
+            stats = run_coordinator(args.videos, os.path.join(directory, "jobs.db"), args.job_seconds,
+                                    local_workers=workers, poll_interval=1.0,
+                                    db_path=os.path.join(directory, "sightings.db"))
+        fps = stats['frames'] / max(stats['wall_time'], 1e-6)
+        baseline = baseline or fps
+        print(f"Обработчиков: {workers} | кадров: {stats['frames']} | время: {stats['wall_time']:.1f} с | "
+              f"FPS: {fps:.2f} | ускорение: {fps / baseline:.2f}x | событий: {len(stats['events'])}")
@@ -0,0 +1,75 @@
+import argparse
+import csv
+import os
+import time
+
+import cv2
+import numpy as np
+from nomeroff_net import pipeline
+
+from multiscale import set_detection_scale
+from plate_matching import normalize_plate
+from video_recognition import recognize_frames
+
+
+def load_dataset(path):
+    """Загружает изображения и ожидаемые номера
+
+    Номера берутся из labels.csv (файл,номер) или из имени файла (A123BC77.jpg).
+    """
+    labels = {}
+    labels_path = os.path.join(path, "labels.csv")
+    if os.path.exists(labels_path):
+        with open(labels_path, newline='', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                if len(row) >= 2 and row[0] != 'file':
+                    labels[row[0]] = normalize_plate(row[1])
+
+    dataset = []
+    for name in sorted(os.listdir(path)):
+        if not name.lower().endswith((".jpg", ".jpeg", ".png")):
+            continue
+        expected = labels.get(name, normalize_plate(os.path.splitext(name)[0].split("_")[0]))
+        frame = cv2.imread(os.path.join(path, name))
+        if frame is not None:
+            dataset.append((name, frame, expected))
+    return dataset
+
+
+def evaluate(number_plate_detection_and_reading, dataset):
+    latencies = []
+    correct = 0
+    for name, frame, expected in dataset:
+        start_time = time.perf_counter()
+        plates = recognize_frames([frame], number_plate_detection_and_reading)[0]
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        if any(normalize_plate(plate['number']) == expected for plate in plates):
+            correct += 1
+    return np.array(latencies), correct / len(dataset)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Задержка и точность при детекции на уменьшенном кадре")
+    parser.add_argument("dataset", help="Папка с изображениями и labels.csv")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1.0, 0.75, 0.5, 0.33])
+    args = parser.parse_args()
+
+    dataset = load_dataset(args.dataset)
+    if not dataset:
+        raise SystemExit(f"В {args.dataset} нет изображений")
+    print(f"Изображений: {len(dataset)}")
+
+    print("Инициализация системы распознавания...")
+    number_plate_detection_and_reading = pipeline(
+        "number_plate_detection_and_reading",
+        image_loader=None
+    )
+    # Прогрев, чтобы первая конфигурация не платила за ленивую инициализацию
+    recognize_frames([dataset[0][1]], number_plate_detection_and_reading)
+
+    for scale in args.scales:
+        set_detection_scale(number_plate_detection_and_reading, scale, min_width=0)
+        latencies, accuracy = evaluate(number_plate_detection_and_reading, dataset)
+        print(f"Масштаб детекции: {scale:.2f} | среднее: {latencies.mean():.1f} мс | "
+              f"p50: {np.percentile(latencies, 50):.1f} мс | p99: {np.percentile(latencies, 99):.1f} мс | "
+              f"точность: {accuracy * 100:.1f}%")
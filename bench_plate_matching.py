@@ -0,0 +1,83 @@
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from plate_matching import PlateMatcher
+
+LETTERS = 'АВЕКМНОРСТУХ'
+DIGITS = '0123456789'
+
+
+def random_plate(rng):
+    """Случайный номер формата А123ВС77 или А123ВС777"""
+    region = f"{rng.randint(1, 199):02d}" if rng.random() < 0.7 else f"{rng.randint(100, 999)}"
+    return (rng.choice(LETTERS) + ''.join(rng.choice(DIGITS) for _ in range(3)) +
+            rng.choice(LETTERS) + rng.choice(LETTERS) + region)
+
+
+def corrupt(plate, rng):
+    """Вносит одну ошибку OCR: замену, пропуск или лишний символ"""
+    i = rng.randrange(len(plate))
+    kind = rng.choice(('replace', 'delete', 'insert'))
+    if kind == 'replace':
+        alphabet = LETTERS if plate[i] in LETTERS else DIGITS
+        return plate[:i] + rng.choice(alphabet.replace(plate[i], '')) + plate[i + 1:]
+    if kind == 'delete':
+        return plate[:i] + plate[i + 1:]
+    return plate[:i] + rng.choice(DIGITS) + plate[i:]
+
+
+def measure(matcher, queries):
+    latencies = []
+    statuses = {}
+    for query in queries:
+        start_time = time.perf_counter()
+        result = matcher.match(query)
+        latencies.append((time.perf_counter() - start_time) * 1e6)
+        statuses[result['status']] = statuses.get(result['status'], 0) + 1
+    latencies.sort()
+    return {
+        'mean': statistics.mean(latencies),
+        'p50': latencies[len(latencies) // 2],
+        'p99': latencies[int(len(latencies) * 0.99)],
+        'statuses': statuses,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк сверки номеров со списками")
+    parser.add_argument("--size", type=int, default=100000, help="Размер белого списка")
+    parser.add_argument("--queries", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    plates = set()
+    while len(plates) < args.size:
+        plates.add(random_plate(rng))
+    plates = sorted(plates)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        allow_path = os.path.join(tmp_dir, "allow.csv")
+        with open(allow_path, 'w', encoding='utf-8') as f:
+            f.write("number,comment\n")
+            for plate in plates:
+                f.write(f"{plate},\n")
+
+        start_time = time.perf_counter()
+        matcher = PlateMatcher(allow_path, os.path.join(tmp_dir, "deny.csv"))
+        print(f"Загрузка списка из {args.size} номеров: {time.perf_counter() - start_time:.2f} секунд")
+
+        exact = [rng.choice(plates) for _ in range(args.queries)]
+        fuzzy = [corrupt(rng.choice(plates), rng) for _ in range(args.queries)]
+        missing = [random_plate(rng) for _ in range(args.queries)]
+
+        for name, queries in (("Точное совпадение", exact),
+                              ("Одна ошибка OCR", fuzzy),
+                              ("Случайные номера", missing)):
+            result = measure(matcher, queries)
+            print(f"{name}: среднее {result['mean']:.1f} мкс | p50 {result['p50']:.1f} мкс | "
+                  f"p99 {result['p99']:.1f} мкс | {result['statuses']}")
@@ -0,0 +1,96 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from bench_plate_matching import corrupt, random_plate
+from plate_search import PlateSearchIndex
+
+
+def build_synthetic_index(sightings, plates, cameras, days, seed):
+    """Синтетическая история: популярные номера проезжают чаще (распределение Ципфа)"""
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+
+    index = PlateSearchIndex()
+    unique = set()
+    while len(unique) < plates:
+        unique.add(random_plate(rng))
+    for plate in sorted(unique):
+        index._plate_id(plate)
+    for camera in range(cameras):
+        index._camera_id(f"camera:{camera}")
+
+    plate_ids = (np_rng.zipf(1.3, sightings) - 1) % plates
+    now = time.time()
+    times = now - np_rng.random(sightings) * days * 86400
+    camera_ids = np_rng.integers(0, cameras, sightings)
+
+    start_time = time.perf_counter()
+    index.build(plate_ids, times, camera_ids)
+    return index, time.perf_counter() - start_time, now
+
+
+def measure(index, runs, **query):
+    latencies = []
+    found = 0
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        found = len(index.search(**query))
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[-1], found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк поиска по истории проездов")
+    parser.add_argument("--sightings", type=int, default=10_000_000)
+    parser.add_argument("--plates", type=int, default=1_000_000)
+    parser.add_argument("--cameras", type=int, default=8)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"Генерация {args.sightings} записей по {args.plates} номерам...")
+    index, build_time, now = build_synthetic_index(args.sightings, args.plates, args.cameras,
+                                                   args.days, args.seed)
+    print(f"Индекс построен за {build_time:.2f} секунд")
+
+    # Сохраненный индекс загружается при следующем запуске вместо перестройки
+    index_path = os.path.join(tempfile.gettempdir(), "bench_plate_search.index")
+    start_time = time.perf_counter()
+    index.save(index_path)
+    save_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    index = PlateSearchIndex.load(index_path)
+    print(f"Сохранение: {save_time:.2f} с, загрузка: {time.perf_counter() - start_time:.2f} с, "
+          f"файл {os.path.getsize(index_path) / 1024 ** 2:.0f} МБ")
+    os.remove(index_path)
+
+    # Новые записи добавляются к индексу без перестройки
+    np_rng = np.random.default_rng(args.seed + 2)
+    new_plates = [index.plates[i] for i in np_rng.integers(0, len(index.plates), 1000)]
+    start_time = time.perf_counter()
+    index.add_sightings(new_plates, now + np_rng.random(1000), ["camera:0"] * 1000)
+    print(f"Добавление 1000 записей: {(time.perf_counter() - start_time) * 1000:.1f} мс")
+
+    rng = random.Random(args.seed + 1)
+    known = index.plates[rng.randrange(len(index.plates))]
+    month_ago = now - 30 * 86400
+    queries = [
+        ("Точный номер", dict(query=known)),
+        ("Одна ошибка OCR", dict(query=corrupt(known, rng), fuzzy=True)),
+        ("Начало и конец: А1*77", dict(query="А1*77")),
+        ("А1*77 за последний месяц", dict(query="А1*77", since=month_ago)),
+        ("А1*77, месяц, камера 0", dict(query="А1*77", since=month_ago, cameras=["camera:0"])),
+        ("Позиции: ?123??77", dict(query="?123??77")),
+        ("Фрагмент: *23В*", dict(query="*23В*")),
+        ("Регион: *77", dict(query="*77", since=month_ago)),
+    ]
+    for name, query in queries:
+        median, worst, found = measure(index, args.runs, **query)
+        print(f"{name:<28} медиана: {median:8.1f} мс | максимум: {worst:8.1f} мс | найдено: {found}")
@@ -0,0 +1,90 @@
+import argparse
+import multiprocessing as mp
+import time
+
+import cv2
+
+from shared_frames import make_workload, run_shared_memory_pipeline
+
+
+def run_single_process(source, workload, max_frames=None):
+    """Базовый вариант: захват и обработка в одном процессе"""
+    handle = make_workload(workload)
+    cap = cv2.VideoCapture(source)
+    count = 0
+    while max_frames is None or count < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        handle(frame)
+        count += 1
+    cap.release()
+    return count
+
+
+def pickle_capture(source, frames, consumers):
+    cap = cv2.VideoCapture(source)
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.put(frame)
+    cap.release()
+    for _ in range(consumers):
+        frames.put(None)
+
+
+def pickle_worker(frames, done, workload):
+    cv2.setNumThreads(1)
+    handle = make_workload(workload)
+    count = 0
+    while True:
+        frame = frames.get()
+        if frame is None:
+            break
+        handle(frame)
+        count += 1
+    done.put(count)
+
+
+def run_pickle_queue(source, workers, workload):
+    """Для сравнения: кадры целиком сериализуются через multiprocessing.Queue"""
+    frames = mp.Queue(maxsize=workers * 2)
+    done = mp.Queue()
+    processes = [mp.Process(target=pickle_worker, args=(frames, done, workload)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    capture = mp.Process(target=pickle_capture, args=(source, frames, workers))
+    capture.start()
+    count = sum(done.get() for _ in range(workers))
+    capture.join()
+    for process in processes:
+        process.join()
+    return count
+
+
+def report(name, count, elapsed):
+    print(f"{name:<38} кадров: {count:6d} | время: {elapsed:7.2f} с | {count / elapsed:7.1f} кадр/с")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сравнение передачи кадров между процессами "
+                                                 "(только замер, в распознавании кольцо не используется)")
+    parser.add_argument("video", help="Путь к тестовому видео")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--workload", default="blur:4",
+                        help="recognize - полный пайплайн, blur:N - синтетическая нагрузка")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    count = run_single_process(args.video, args.workload)
+    report("Один процесс", count, time.perf_counter() - start_time)
+
+    for workers in args.workers:
+        start_time = time.perf_counter()
+        count = run_pickle_queue(args.video, workers, args.workload)
+        report(f"multiprocessing.Queue, обработчиков: {workers}", count, time.perf_counter() - start_time)
+
+        start_time = time.perf_counter()
+        count = len(run_shared_memory_pipeline(args.video, workers, workload=args.workload))
+        report(f"Разделяемая память, обработчиков: {workers}", count, time.perf_counter() - start_time)
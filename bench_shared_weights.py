@@ -0,0 +1,126 @@
+import argparse
+import multiprocessing as mp
+import os
+import tempfile
+import time
+
+import torch
+
+from shared_weights import WEIGHTS_PATH, load_pipeline, memory_usage, share_weights
+
+
+class SyntheticStage:
+    """Этап пайплайна с моделью заданного размера, для проверки без настоящих моделей"""
+
+    def __init__(self, layers):
+        self.model = torch.nn.Sequential(*[torch.nn.Linear(2048, 2048) for _ in range(layers)]).eval()
+
+    def __call__(self, inputs):
+        return self.model(inputs)
+
+
+class SyntheticPipeline:
+    def __init__(self, size_mb):
+        torch.manual_seed(0)
+        # Один слой 2048x2048 float32 - 16 МБ
+        layers = max(size_mb // 16, 2)
+        self.number_plate_localization = SyntheticStage(layers // 2)
+        self.number_plate_text_reading = [SyntheticStage(layers - layers // 2)]
+
+    def run(self):
+        with torch.no_grad():
+            inputs = torch.ones(1, 2048)
+            self.number_plate_localization(inputs)
+            for stage in self.number_plate_text_reading:
+                stage(inputs)
+
+
+def load(mode, synthetic_mb, path):
+    if synthetic_mb:
+        number_plate_detection_and_reading = SyntheticPipeline(synthetic_mb)
+        if mode != "private":
+            share_weights(number_plate_detection_and_reading, path)
+        return number_plate_detection_and_reading
+    return load_pipeline(image_loader=None, shared=mode != "private", path=path)
+
+
+def infer(number_plate_detection_and_reading, synthetic_mb):
+    """Один прогон, чтобы все веса были прочитаны"""
+    if synthetic_mb:
+        number_plate_detection_and_reading.run()
+    else:
+        from auto_tuner import SampleInput, warm_up
+        sample = SampleInput(uses_paths=False)
+        warm_up(number_plate_detection_and_reading, sample, runs=1)
+        sample.close()
+
+
+def worker(mode, synthetic_mb, path, barrier, results, preloaded=None):
+    torch.set_num_threads(1)
+    start_time = time.time()
+    number_plate_detection_and_reading = preloaded or load(mode, synthetic_mb, path)
+    load_time = time.time() - start_time
+    infer(number_plate_detection_and_reading, synthetic_mb)
+
+    # Память меряется, когда все обработчики загружены: PSS зависит от числа соседей
+    barrier.wait()
+    usage = memory_usage()
+    usage['load_time'] = load_time
+    results.put(usage)
+    barrier.wait()
+
+
+def run(mode, workers, synthetic_mb, path):
+    """mode: private - свои веса в каждом процессе, mmap - общий файл весов,
+    fork - родитель загружает общие веса один раз и порождает обработчики"""
+    context = mp.get_context("fork" if mode == "fork" else "spawn")
+    barrier = context.Barrier(workers + 1)
+    results = context.Queue()
+
+    start_time = time.time()
+    preloaded = load(mode, synthetic_mb, path) if mode == "fork" else None
+    parent_load_time = time.time() - start_time
+
+    processes = [context.Process(target=worker, args=(mode, synthetic_mb, path, barrier, results, preloaded))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    barrier.wait()
+    parent = memory_usage()
+    stats = [results.get() for _ in range(workers)]
+    ready_time = time.time() - start_time
+    barrier.wait()
+    for process in processes:
+        process.join()
+
+    return {
+        'load_time': parent_load_time + max(s['load_time'] for s in stats),
+        'ready_time': ready_time,
+        'peak_rss': max(s['peak_rss'] for s in stats),
+        'total_pss': parent['pss'] + sum(s['pss'] for s in stats),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Память и время загрузки: свои веса против общих")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--modes", nargs="+", default=["private", "mmap", "fork"])
+    parser.add_argument("--synthetic-mb", type=int, default=0,
+                        help="Вместо настоящего пайплайна - модели заданного размера в МБ")
+    parser.add_argument("--path", default=None, help=f"Файл общих весов (по умолчанию {WEIGHTS_PATH})")
+    args = parser.parse_args()
+
+    path = args.path
+    if path is None:
+        path = os.path.join(tempfile.gettempdir(), "synthetic_weights.pt") if args.synthetic_mb else WEIGHTS_PATH
+    # Файл весов создается заранее, чтобы его запись не попала в замеры
+    if any(mode != "private" for mode in args.modes):
+        load("mmap", args.synthetic_mb, path)
+
+    for mode in args.modes:
+        for workers in args.workers:
+            stats = run(mode, workers, args.synthetic_mb, path)
+            print(f"{mode:<8} | обработчиков: {workers} | загрузка: {stats['load_time']:6.2f} с | "
+                  f"готовы через: {stats['ready_time']:6.2f} с | "
+                  f"пиковый RSS обработчика: {stats['peak_rss'] / 1024 ** 2:7.0f} МБ | "
+                  f"всего памяти (PSS): {stats['total_pss'] / 1024 ** 2:7.0f} МБ")
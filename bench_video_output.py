@@ -0,0 +1,98 @@
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+
+from evidence_writer import EvidenceWriter
+from video_output import AnnotatedVideoWriter, EventClipWriter, annotate_frame, draw_timestamp
+
+
+def synthetic_plates(frame, media_s, event_every, event_length):
+    """Номер в центре кадра в течение event_length секунд каждые event_every секунд"""
+    if media_s % event_every >= event_length:
+        return []
+    height, width = frame.shape[:2]
+    number = f"А {int(media_s // event_every) % 1000:03d} ВС 77"
+    bbox = [width * 0.4, height * 0.6, width * 0.6, height * 0.68]
+    return [{'number': number, 'confidence': 0.9, 'bbox': bbox}]
+
+
+def run_mode(mode, video_path, output_dir, event_every, event_length, max_frames):
+    """Прогоняет видео через один режим вывода; возвращает кадры, файлы, байты и CPU"""
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+
+    evidence_writer = EvidenceWriter(output_dir, max_disk_bytes=0) if mode == "jpeg" else None
+    video_writer = AnnotatedVideoWriter(os.path.join(output_dir, "annotated.mp4"), fps) if mode == "video" else None
+    clip_writer = EventClipWriter(output_dir, fps) if mode == "clips" else None
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    frames = 0
+    while frames < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        media_s = frames / fps
+        plates = synthetic_plates(frame, media_s, event_every, event_length)
+        frames += 1
+
+        if mode == "decode":
+            continue
+        annotated = annotate_frame(frame, plates) if plates else frame
+        if mode == "frames":
+            # Прежнее поведение: отдельный JPEG на каждый кадр с номером
+            if plates:
+                cv2.imwrite(os.path.join(output_dir, f"processed_{frames:06d}.jpg"), annotated)
+        elif mode == "jpeg":
+            for plate in plates:
+                evidence_writer.offer(plate['number'], plate['confidence'], annotated, plate['bbox'], media_s)
+            evidence_writer.expire(media_s)
+        else:
+            draw_timestamp(annotated, f"{media_s:8.2f}")
+            if video_writer is not None:
+                video_writer.write(annotated)
+            else:
+                clip_writer.add(annotated, plates, media_s)
+
+    for writer in (evidence_writer, video_writer, clip_writer):
+        if writer is not None:
+            writer.close()
+    cap.release()
+
+    cpu_seconds = time.process_time() - cpu_start
+    wall_seconds = time.perf_counter() - wall_start
+    files = os.listdir(output_dir)
+    size = sum(os.path.getsize(os.path.join(output_dir, name)) for name in files)
+    return frames, len(files), size, cpu_seconds, wall_seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Место на диске и CPU: JPEG-снимки против видео и роликов")
+    parser.add_argument("video", help="Видео для прогона")
+    parser.add_argument("--event-every", type=float, default=10.0, help="Проезд каждые N секунд")
+    parser.add_argument("--event-length", type=float, default=3.0, help="Номер виден N секунд")
+    parser.add_argument("--max-frames", type=int, default=3000)
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("decode", "frames", "jpeg", "video", "clips"):
+        with tempfile.TemporaryDirectory() as output_dir:
+            results[mode] = run_mode(mode, args.video, output_dir, args.event_every,
+                                     args.event_length, args.max_frames)
+
+    # Чтение и декодирование видео одинаковы для всех режимов, поэтому вычитаются
+    base_cpu = results["decode"][3]
+    names = {
+        "frames": "JPEG на каждый кадр",
+        "jpeg": "Снимок на событие",
+        "video": "Видео целиком",
+        "clips": "Ролики событий",
+    }
+    for mode, name in names.items():
+        frames, files, size, cpu_seconds, wall_seconds = results[mode]
+        print(f"{name:<20} | файлов: {files:6d} | {size / 1024 ** 2:8.1f} МБ | "
+              f"CPU на запись: {max(cpu_seconds - base_cpu, 0):6.2f} с | "
+              f"{frames / max(wall_seconds, 1e-6):6.1f} кадров/с")
@@ -0,0 +1,362 @@
+import os
+import queue
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+import cv2
+
+V4L2_SYSFS = "/sys/class/video4linux"
+
+
+def list_v4l2_devices():
+    """Перечисляет камеры через sysfs без открытия устройств (только Linux)"""
+    devices = []
+    if not os.path.isdir(V4L2_SYSFS):
+        return devices
+
+    for entry in os.listdir(V4L2_SYSFS):
+        match = re.match(r'^video(\d+)$', entry)
+        if not match:
+            continue
+        base = os.path.join(V4L2_SYSFS, entry)
+        # У одной камеры бывает несколько узлов, узлы метаданных имеют index > 0
+        try:
+            with open(os.path.join(base, "index")) as f:
+                if int(f.read().strip() or 0) != 0:
+                    continue
+        except (OSError, ValueError):
+            pass
+        try:
+            with open(os.path.join(base, "name"), encoding="utf-8", errors="replace") as f:
+                name = f.read().strip()
+        except OSError:
+            name = entry
+        devices.append({'index': int(match.group(1)), 'name': name, 'path': f"/dev/{entry}"})
+
+    return sorted(devices, key=lambda device: device['index'])
+
+
+def list_v4l2_formats(device_path, timeout=2.0):
+    """Возвращает поддерживаемые разрешения и FPS по данным v4l2-ctl"""
+    if not shutil.which("v4l2-ctl"):
+        return []
+    try:
+        output = subprocess.run(
+            ["v4l2-ctl", "--device", device_path, "--list-formats-ext"],
+            capture_output=True, text=True, timeout=timeout
+        ).stdout
+    except (subprocess.SubprocessError, OSError):
+        return []
+
+    modes = {}
+    current = None
+    for line in output.splitlines():
+        size = re.search(r'Size: \w+ (\d+)x(\d+)', line)
+        if size:
+            current = (int(size.group(1)), int(size.group(2)))
+            modes.setdefault(current, set())
+            continue
+        fps = re.search(r'\(([\d.]+) fps\)', line)
+        if fps and current is not None:
+            modes[current].add(float(fps.group(1)))
+
+    return [{'width': w, 'height': h, 'fps': sorted(rates, reverse=True)}
+            for (w, h), rates in sorted(modes.items(), reverse=True)]
+
+
+def query_formats(device_paths, timeout=2.0):
+    """Параллельно запрашивает режимы нескольких камер; возвращает словарь путь -> режимы"""
+    results = {}
+
+    def run(path):
+        results[path] = list_v4l2_formats(path, timeout)
+
+    threads = [threading.Thread(target=run, args=(path,), daemon=True) for path in device_paths]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + timeout
+    for thread in threads:
+        thread.join(max(deadline - time.monotonic(), 0))
+    return {path: results.get(path, []) for path in device_paths}
+
+
+def probe_camera(index):
+    """Открывает камеру и читает один кадр; возвращает описание или None"""
+    cap = cv2.VideoCapture(index)
+    try:
+        if not cap.isOpened():
+            return None
+        ret, frame = cap.read()
+        if not ret:
+            return None
+        height, width = frame.shape[:2]
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        return {'index': index, 'name': f"Камера {index}", 'path': None,
+                'modes': [{'width': width, 'height': height, 'fps': [fps] if fps else []}]}
+    finally:
+        cap.release()
+
+
+def probe_cameras(indices, timeout=3.0):
+    """Параллельно проверяет индексы камер, зависшие проверки отбрасываются по таймауту"""
+    results = {}
+
+    def run(index):
+        try:
+            results[index] = probe_camera(index)
+        except Exception:
+            results[index] = None
+
+    # Потоки-демоны не мешают завершению программы, если драйвер завис
+    threads = [threading.Thread(target=run, args=(index,), daemon=True) for index in indices]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + timeout
+    for thread in threads:
+        thread.join(max(deadline - time.monotonic(), 0))
+
+    return [results[index] for index in indices if results.get(index)]
+
+
+class CameraDiscovery:
+    """Поиск камер с кэшированием результатов"""
+
+    def __init__(self, max_index=10, probe_timeout=3.0, cache_ttl=30.0):
+        self.max_index = max_index
+        self.probe_timeout = probe_timeout
+        self.cache_ttl = cache_ttl
+        self.cameras = []
+        self.cache_time = None
+        self.formats_cache = {}
+        # lock защищает кэш и держится недолго; refresh_lock - сам поиск, который
+        # может длиться секунды и не должен задерживать чтение кэша
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.use_sysfs = sys.platform.startswith("linux") and os.path.isdir(V4L2_SYSFS)
+
+    def discover(self, force=False, busy=()):
+        """Возвращает список камер; busy - индексы уже открытых камер, их не трогаем
+
+        Если поиск уже идет в другом потоке, без force сразу возвращается кэш.
+        """
+        with self.lock:
+            if (not force and self.cache_time is not None and
+                    time.monotonic() - self.cache_time < self.cache_ttl):
+                return list(self.cameras)
+            has_cache = self.cache_time is not None
+
+        if not self.refresh_lock.acquire(blocking=force or not has_cache):
+            with self.lock:
+                return list(self.cameras)
+        try:
+            if self.use_sysfs:
+                devices = list_v4l2_devices()
+                with self.lock:
+                    formats_cache = dict(self.formats_cache)
+                missing = [device for device in devices
+                           if (device['path'], device['name']) not in formats_cache]
+                formats = query_formats([device['path'] for device in missing])
+                for device in missing:
+                    formats_cache[(device['path'], device['name'])] = formats[device['path']]
+                cameras = [dict(device, modes=formats_cache[(device['path'], device['name'])])
+                           for device in devices]
+            else:
+                with self.lock:
+                    previous = {camera['index']: camera for camera in self.cameras}
+                indices = [i for i in range(self.max_index) if i not in busy]
+                cameras = probe_cameras(indices, self.probe_timeout)
+                cameras += [previous[i] for i in busy if i in previous]
+                cameras.sort(key=lambda camera: camera['index'])
+                formats_cache = None
+
+            with self.lock:
+                if formats_cache is not None:
+                    self.formats_cache = formats_cache
+                self.cameras = cameras
+                self.cache_time = time.monotonic()
+                return list(cameras)
+        finally:
+            self.refresh_lock.release()
+
+
+def describe_camera(camera):
+    """Строка с описанием камеры для диалога выбора"""
+    text = f"{camera['index']}: {camera['name']}"
+    if camera.get('modes'):
+        best = camera['modes'][0]
+        fps = f" @ {best['fps'][0]:.0f} FPS" if best['fps'] else ""
+        text += f" ({best['width']}x{best['height']}{fps}, режимов: {len(camera['modes'])})"
+    return text
+
+
+class CameraWatcher:
+    """Фоновое отслеживание подключения и отключения камер
+
+    Изменения складываются в очередь, которую забирает поток интерфейса.
+    """
+
+    def __init__(self, discovery, interval=2.0):
+        self.discovery = discovery
+        # Без sysfs каждая проверка открывает камеры, поэтому опрашиваем реже
+        self.interval = interval if discovery.use_sysfs else max(interval, 15.0)
+        self.changes = queue.Queue()
+        # Открытые программой камеры: меняются из потока интерфейса, читаются фоновым
+        self.busy = set()
+        self.busy_lock = threading.Lock()
+        self.running = False
+        self.thread = None
+        self.known = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="camera-watcher", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def mark_busy(self, index):
+        with self.busy_lock:
+            self.busy.add(index)
+
+    def release_busy(self, index):
+        with self.busy_lock:
+            self.busy.discard(index)
+
+    def busy_indices(self):
+        """Копия набора занятых камер"""
+        with self.busy_lock:
+            return set(self.busy)
+
+    def _run(self):
+        # Первый поиск только заполняет кэш и не считается изменением
+        try:
+            self.known = {camera['index']: camera for camera in self.discovery.discover()}
+        except Exception as e:
+            print(f"Ошибка при поиске камер: {str(e)}")
+            self.known = {}
+
+        while self.running:
+            time.sleep(self.interval)
+            try:
+                current = {camera['index']: camera
+                           for camera in self.discovery.discover(force=True, busy=self.busy_indices())}
+            except Exception as e:
+                print(f"Ошибка при поиске камер: {str(e)}")
+                continue
+
+            for index in current.keys() - self.known.keys():
+                self.changes.put(('added', current[index]))
+            for index in self.known.keys() - current.keys():
+                self.changes.put(('removed', self.known[index]))
+            self.known = current
+
+    def drain(self):
+        """Забирает накопленные изменения без блокировки"""
+        changes = []
+        while True:
+            try:
+                changes.append(self.changes.get_nowait())
+            except queue.Empty:
+                return changes
+
+
+class ReconnectingCapture:
+    """Обертка над cv2.VideoCapture, которая переподключается при обрыве потока
+
+    Переподключение идет в фоновом потоке: открытие отсутствующего устройства
+    (DSHOW/MSMF в Windows) может занимать секунды и не должно задерживать
+    поток интерфейса. Пока связи нет, read() возвращает (False, None).
+    """
+
+    def __init__(self, source, width=None, height=None, retry_interval=1.0, max_retry_interval=10.0):
+        self.source = source
+        self.width = width
+        self.height = height
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.current_interval = retry_interval
+        self.next_retry = 0.0
+        self.reconnects = 0
+        self.connected = False
+        self.closed = False
+        self.lock = threading.Lock()
+        self.reconnect_thread = None
+        self.cap = self._open()
+        self.connected = self.cap is not None
+
+    def _open(self):
+        """Открывает источник; возвращает захват или None"""
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            cap.release()
+            return None
+        if self.width and self.height:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        return cap
+
+    def _reconnect(self):
+        """Фоновый поток: одна попытка переподключения"""
+        cap = self._open()
+        with self.lock:
+            if cap is not None and not self.closed:
+                self.cap = cap
+                self.connected = True
+                self.reconnects += 1
+                self.current_interval = self.retry_interval
+                return
+            # Увеличиваем паузу между попытками, чтобы не нагружать систему
+            self.next_retry = time.monotonic() + self.current_interval
+            self.current_interval = min(self.current_interval * 2, self.max_retry_interval)
+        if cap is not None:
+            # Захват закрыли, пока шло переподключение
+            cap.release()
+
+    def isOpened(self):
+        cap = self.cap
+        return cap is not None and cap.isOpened()
+
+    def read(self):
+        """Читает кадр; при обрыве возвращает (False, None) и переподключается в фоне с паузами"""
+        cap = self.cap
+        if cap is not None:
+            ret, frame = cap.read()
+            if ret:
+                return ret, frame
+            with self.lock:
+                if self.cap is cap:
+                    self.cap = None
+                    self.connected = False
+                    self.next_retry = time.monotonic() + self.current_interval
+            cap.release()
+            return False, None
+
+        with self.lock:
+            if (self.closed or time.monotonic() < self.next_retry or
+                    (self.reconnect_thread is not None and self.reconnect_thread.is_alive())):
+                return False, None
+            self.reconnect_thread = threading.Thread(target=self._reconnect, name="camera-reconnect",
+                                                     daemon=True)
+            self.reconnect_thread.start()
+        return False, None
+
+    def get(self, prop):
+        cap = self.cap
+        return cap.get(prop) if cap is not None else 0.0
+
+    def set(self, prop, value):
+        cap = self.cap
+        return cap.set(prop, value) if cap is not None else False
+
+    def release(self):
+        with self.lock:
+            self.closed = True
+            cap, self.cap = self.cap, None
+            self.connected = False
+        if cap is not None:
+            cap.release()
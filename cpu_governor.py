@@ -0,0 +1,218 @@
+import os
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+import torch
+
+
+class CpuGovernor:
+    """Держит нагрузку распознавания в пределах бюджета CPU и/или задержки
+
+    Раз в interval секунд измеряет долю процессорного времени процесса от всех
+    ядер и задержку распознавания, затем по одному шагу меняет параметры.
+    При превышении бюджета CPU: частота превью, число потоков, шаг детекции
+    (или пауза между пакетами, если пропускать кадры нельзя). При превышении
+    задержки - только размер пакета и число потоков: пропуск кадров и пауза
+    задержку одного вызова не уменьшают; когда менять больше нечего, бюджет
+    задержки один раз объявляется недостижимым. При запасе параметры
+    возвращаются в обратном порядке, начиная с шага детекции. Пока есть активные проезды, шаг не
+    больше active_stride, чтобы номер не потерялся.
+    """
+
+    def __init__(self, cpu_budget=50.0, latency_budget_ms=None, interval=2.0,
+                 max_stride=8, active_stride=2, min_threads=1, max_threads=None,
+                 max_cv2_threads=None, max_batch=1, min_preview_fps=5, max_preview_fps=25, allow_skip=True,
+                 max_pause_ms=500, pause_step_ms=20):
+        # cpu_budget - процент от всех ядер компьютера; None - без ограничения CPU
+        self.cpu_budget = cpu_budget
+        self.latency_budget_ms = latency_budget_ms
+        self.interval = interval
+        self.max_stride = max_stride
+        self.active_stride = active_stride
+        self.min_threads = min_threads
+        self.max_threads = max_threads or torch.get_num_threads()
+        # Потоки OpenCV подобраны отдельно (auto_tuner) и уменьшаются в той же пропорции
+        self.max_cv2_threads = max_cv2_threads or cv2.getNumThreads()
+        self.max_batch = max_batch
+        self.min_preview_fps = min_preview_fps
+        self.max_preview_fps = max_preview_fps
+        # allow_skip=False (архив без превью): вместо пропуска кадров - пауза между пакетами
+        self.allow_skip = allow_skip
+        self.max_pause_ms = max_pause_ms
+        self.pause_step_ms = pause_step_ms
+        self.cpu_count = os.cpu_count() or 1
+
+        self.stride = 1
+        self.threads = self.max_threads
+        self.cv2_threads = self.max_cv2_threads
+        self.batch_size = max_batch
+        self.preview_fps = max_preview_fps
+        self.pause_ms = 0
+
+        self.active_tracks = 0
+        self.cpu_percent = 0.0
+        self.latencies = deque(maxlen=100)
+        self.decision = "полная нагрузка"
+        self.latency_unreachable = False
+        self.last_cpu = time.process_time()
+        self.last_wall = time.monotonic()
+        self.last_render = 0.0
+        self._apply_threads()
+
+    def _apply_threads(self):
+        torch.set_num_threads(self.threads)
+        self.cv2_threads = max(round(self.max_cv2_threads * self.threads / self.max_threads), 1)
+        cv2.setNumThreads(self.cv2_threads)
+
+    def effective_stride(self):
+        if self.active_tracks:
+            return min(self.stride, self.active_stride)
+        return self.stride
+
+    def should_process(self, frame_index):
+        """Распознавать ли кадр с этим номером"""
+        return frame_index % self.effective_stride() == 0
+
+    def should_render(self, force=False):
+        """Обновлять ли превью: не чаще preview_fps раз в секунду"""
+        now = time.monotonic()
+        if force or now - self.last_render >= 1.0 / self.preview_fps:
+            self.last_render = now
+            return True
+        return False
+
+    def record(self, latency):
+        """Учитывает время одного вызова распознавания в секундах"""
+        self.latencies.append(latency * 1000)
+
+    def latency_ms(self):
+        return float(np.percentile(self.latencies, 95)) if self.latencies else 0.0
+
+    def update(self, active_tracks=0):
+        """Измеряет нагрузку и при необходимости меняет параметры
+
+        Возвращает описание принятого решения или None, если ничего не изменилось.
+        """
+        self.active_tracks = active_tracks
+        now = time.monotonic()
+        wall = now - self.last_wall
+        if wall < self.interval:
+            return None
+        cpu = time.process_time()
+        self.cpu_percent = (cpu - self.last_cpu) / wall / self.cpu_count * 100
+        self.last_cpu, self.last_wall = cpu, now
+
+        latency = self.latency_ms()
+        cpu_over = self.cpu_budget and self.cpu_percent > self.cpu_budget * 1.05
+        latency_over = self.latency_budget_ms and latency > self.latency_budget_ms
+        cpu_spare = not self.cpu_budget or self.cpu_percent < self.cpu_budget * 0.75
+        latency_spare = not self.latency_budget_ms or latency < self.latency_budget_ms * 0.75
+
+        decision = None
+        if not latency_over:
+            self.latency_unreachable = False
+        if latency_over:
+            decision = self._reduce_latency()
+        elif cpu_over:
+            decision = self._reduce_cpu()
+        elif cpu_spare and latency_spare:
+            decision = self._restore()
+        if decision:
+            self.decision = decision
+        return decision
+
+    def _increase_skip(self):
+        # Пока идет проезд, шаг все равно ограничен active_stride: превышение бюджета допускаем
+        if self.allow_skip and self.active_tracks and self.stride >= self.active_stride:
+            return None
+        if self.allow_skip and self.stride < self.max_stride:
+            self.stride += 1
+            return f"шаг детекции {self.stride}"
+        if not self.allow_skip and self.pause_ms < self.max_pause_ms:
+            self.pause_ms = min(self.pause_ms + self.pause_step_ms, self.max_pause_ms)
+            return f"пауза между пакетами {self.pause_ms} мс"
+        return None
+
+    def _reduce_cpu(self):
+        if self.allow_skip and self.preview_fps > self.min_preview_fps:
+            self.preview_fps = max(self.preview_fps // 2, self.min_preview_fps)
+            return f"превью {self.preview_fps} FPS"
+        if self.threads > self.min_threads:
+            self.threads -= 1
+            self._apply_threads()
+            return f"потоков {self.threads}"
+        return self._increase_skip()
+
+    def _reduce_latency(self):
+        if self.batch_size > 1:
+            self.batch_size = max(self.batch_size // 2, 1)
+            return f"пакет {self.batch_size}"
+        if self.threads > self.min_threads:
+            self.threads -= 1
+            self._apply_threads()
+            return f"потоков {self.threads}"
+        if not self.latency_unreachable:
+            self.latency_unreachable = True
+            return f"бюджет задержки {self.latency_budget_ms:.0f} мс недостижим"
+        return None
+
+    def _restore(self):
+        if self.pause_ms:
+            self.pause_ms = max(self.pause_ms - self.pause_step_ms, 0)
+            return f"пауза между пакетами {self.pause_ms} мс"
+        if self.stride > 1:
+            self.stride -= 1
+            return f"шаг детекции {self.stride}"
+        if self.threads < self.max_threads:
+            self.threads += 1
+            self._apply_threads()
+            return f"потоков {self.threads}"
+        if self.allow_skip and self.preview_fps < self.max_preview_fps:
+            self.preview_fps = min(self.preview_fps * 2, self.max_preview_fps)
+            return f"превью {self.preview_fps} FPS"
+        if self.batch_size < self.max_batch:
+            self.batch_size = min(self.batch_size * 2, self.max_batch)
+            return f"пакет {self.batch_size}"
+        return None
+
+    def pause(self):
+        """Пауза после пакета в режиме без пропуска кадров"""
+        if self.pause_ms:
+            time.sleep(self.pause_ms / 1000)
+
+    def stats(self):
+        """Текущие измерения и решения регулятора"""
+        return {
+            'cpu_percent': self.cpu_percent,
+            'cpu_budget': self.cpu_budget,
+            'latency_p95_ms': self.latency_ms(),
+            'latency_budget_ms': self.latency_budget_ms,
+            'stride': self.stride,
+            'effective_stride': self.effective_stride(),
+            'threads': self.threads,
+            'cv2_threads': self.cv2_threads,
+            'batch_size': self.batch_size,
+            'preview_fps': self.preview_fps,
+            'pause_ms': self.pause_ms,
+            'active_tracks': self.active_tracks,
+            'decision': self.decision,
+        }
+
+    def describe(self):
+        """Строка состояния для лога и интерфейса"""
+        text = f"CPU {self.cpu_percent:.0f}%"
+        if self.cpu_budget:
+            text += f"/{self.cpu_budget:.0f}%"
+        if self.latency_budget_ms:
+            text += f" | задержка {self.latency_ms():.0f}/{self.latency_budget_ms:.0f} мс"
+        text += (f" | шаг {self.effective_stride()} | потоков {self.threads} (OpenCV {self.cv2_threads})"
+                 f" | пакет {self.batch_size}")
+        if self.allow_skip:
+            text += f" | превью {self.preview_fps} FPS"
+        else:
+            text += f" | пауза {self.pause_ms} мс"
+        if self.active_tracks:
+            text += f" | активных проездов {self.active_tracks}"
+        return text
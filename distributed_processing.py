@@ -0,0 +1,417 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import shutil
+import socket
+import time
+import uuid
+
+import cv2
+import torch
+
+from auto_tuner import load_or_tune
+from evidence_writer import EvidenceWriter, enforce_disk_quota
+from multiscale import set_detection_scale
+from shared_weights import load_pipeline
+from sighting_store import SightingStore
+from video_recognition import (format_timestamp, frame_media_ms, guess_recording_start,
+                               parse_start_time, recognize_frames)
+from work_queue import JobQueue
+
+
+class JobLost(Exception):
+    """Задание передано другому обработчику (не было отметок дольше тайм-аута)"""
+
+
+def video_duration_ms(video_path):
+    """Длительность видео по числу кадров и FPS из контейнера"""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Не удалось открыть видео файл {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    cap.release()
+    return frame_count * 1000.0 / fps
+
+
+def split_video(video_path, job_seconds=60.0, recording_start=None):
+    """Делит видео на задания по отрезкам времени [start_ms, end_ms)
+
+    Число кадров в контейнере бывает неточным, поэтому последний отрезок
+    открыт до конца файла.
+    """
+    duration_ms = video_duration_ms(video_path)
+    if recording_start is None:
+        recording_start = guess_recording_start(video_path, duration_ms / 1000)
+
+    job_ms = job_seconds * 1000.0
+    jobs = []
+    start_ms = 0.0
+    while True:
+        end_ms = start_ms + job_ms
+        if end_ms >= duration_ms:
+            jobs.append((video_path, start_ms, float('inf'), recording_start))
+            return jobs
+        jobs.append((video_path, start_ms, end_ms, recording_start))
+        start_ms = end_ms
+
+
+def process_job(job, number_plate_detection_and_reading, batch_size=1, heartbeat=None,
+                evidence_writer=None, confidence_threshold=0.0):
+    """Распознает номера на отрезке видео задания и возвращает записи о проездах
+
+    heartbeat вызывается после каждого пакета; если он вернул False, задание прерывается.
+    """
+    cap = cv2.VideoCapture(job['video'])
+    if not cap.isOpened():
+        raise IOError(f"Не удалось открыть видео файл {job['video']}")
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    start_ms, end_ms = job['start_ms'], job['end_ms']
+    frame_index = 0
+    if start_ms > 0:
+        cap.set(cv2.CAP_PROP_POS_MSEC, start_ms)
+        frame_index = int(round(start_ms * fps / 1000))
+
+    sightings = []
+    frames = 0
+    batch, batch_times = [], []
+
+    def flush_batch():
+        for frame, media_ms, plates in zip(batch, batch_times,
+                                           recognize_frames(batch, number_plate_detection_and_reading,
+                                                            confidence_threshold)):
+            frame_time = job['recording_start'] + media_ms / 1000
+            for plate in plates:
+                sightings.append({
+                    'number': plate['number'],
+                    'confidence': plate['confidence'],
+                    'bbox': plate['bbox'],
+                    'media_ms': media_ms,
+                    'ts': frame_time,
+                    'timestamp': format_timestamp(frame_time),
+                    'source': job['video'],
+                })
+                if evidence_writer is not None and plate['bbox'] is not None:
+                    evidence_writer.offer(plate['number'], plate['confidence'], frame,
+                                          plate['bbox'], frame_time)
+            if evidence_writer is not None:
+                evidence_writer.expire(frame_time)
+        batch.clear()
+        batch_times.clear()
+        if heartbeat is not None and not heartbeat():
+            raise JobLost(f"Задание {job['id']} передано другому обработчику")
+
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            media_ms = frame_media_ms(cap, frame_index, fps)
+            frame_index += 1
+            # Перемотка может встать чуть раньше начала отрезка
+            if media_ms < start_ms:
+                continue
+            if media_ms >= end_ms:
+                break
+            frames += 1
+            batch.append(frame)
+            batch_times.append(media_ms)
+            if len(batch) >= batch_size:
+                flush_batch()
+        if batch:
+            flush_batch()
+    finally:
+        cap.release()
+    return sightings, frames
+
+
+def run_worker(queue_path="reports/jobs.db", worker_id=None, threads=None, detection_scale=1.0,
+               heartbeat_interval=5.0, heartbeat_timeout=30.0, poll_interval=2.0,
+               exit_when_idle=False, results_dir="results", shared_weights=True,
+               number_plate_detection_and_reading=None, startup_lock=None):
+    """Обработчик: забирает задания из очереди, пока они есть
+
+    exit_when_idle - завершиться, когда в очереди не останется ждущих и выполняемых заданий.
+    shared_weights - веса отображаются из общего файла и не дублируются в каждом обработчике.
+    number_plate_detection_and_reading - пайплайн, уже загруженный родительским процессом.
+    startup_lock - общая с соседними обработчиками блокировка: модели загружаются
+    по очереди, а не всеми процессами одновременно.
+    Снимки задания пишутся в results_dir/<пакет>/job_<id> без квоты: общую квоту
+    папки соблюдает координатор.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    queue = JobQueue(queue_path, heartbeat_timeout=heartbeat_timeout)
+
+    if number_plate_detection_and_reading is None:
+        if startup_lock is not None:
+            startup_lock.acquire()
+        try:
+            print(f"[{worker_id}] Инициализация системы распознавания...")
+            number_plate_detection_and_reading = load_pipeline(image_loader=None, shared=shared_weights)
+        finally:
+            if startup_lock is not None:
+                startup_lock.release()
+    set_detection_scale(number_plate_detection_and_reading, detection_scale)
+    # Одновременно стартующие обработчики не подбирают параметры параллельно:
+    # подбор выполняет один из них, остальные берут сохраненный результат
+    tuning = load_or_tune(number_plate_detection_and_reading, uses_paths=False)
+    # Несколько обработчиков на одном компьютере делят ядра между собой
+    if threads:
+        torch.set_num_threads(threads)
+    evidence_writer = EvidenceWriter(results_dir, max_disk_bytes=None)
+
+    try:
+        while True:
+            job = queue.claim(worker_id)
+            if job is None:
+                if exit_when_idle and queue.active() == 0:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            print(f"[{worker_id}] Задание {job['id']}: {job['video']} "
+                  f"{job['start_ms'] / 1000:.0f}-{job['end_ms'] / 1000:.0f} с (попытка {job['attempt']})")
+            last_heartbeat = time.monotonic()
+
+            # Снимки привязаны к заданию: повторная попытка заменяет снимки прерванной
+            job_dir = os.path.join(results_dir, job['batch'], f"job_{job['id']}")
+            if os.path.exists(job_dir):
+                shutil.rmtree(job_dir, ignore_errors=True)
+            os.makedirs(job_dir, exist_ok=True)
+            evidence_writer.output_dir = job_dir
+
+            def heartbeat():
+                nonlocal last_heartbeat
+                if time.monotonic() - last_heartbeat < heartbeat_interval:
+                    return True
+                last_heartbeat = time.monotonic()
+                return queue.heartbeat(job['id'], worker_id)
+
+            start_time = time.time()
+            try:
+                sightings, frames = process_job(job, number_plate_detection_and_reading,
+                                                tuning['batch_size'], heartbeat, evidence_writer)
+            except JobLost as e:
+                print(f"[{worker_id}] {e}")
+                # Незавершенные события досчитает новый обработчик задания
+                evidence_writer.discard()
+                continue
+            except Exception as e:
+                print(f"[{worker_id}] Ошибка в задании {job['id']}: {e}")
+                queue.fail(job['id'], worker_id, e)
+                continue
+            finally:
+                # События архива не продолжаются в следующем задании
+                evidence_writer.expire()
+
+            seconds = time.time() - start_time
+            if queue.complete(job['id'], worker_id, sightings, frames, seconds):
+                print(f"[{worker_id}] Задание {job['id']} выполнено: {frames} кадров, "
+                      f"{len(sightings)} номеров, {frames / max(seconds, 1e-6):.2f} FPS")
+            else:
+                print(f"[{worker_id}] Результат задания {job['id']} отброшен: оно передано другому")
+    finally:
+        evidence_writer.close()
+        queue.close()
+
+
+def merge_events(sightings, event_gap=2.0):
+    """Объединяет записи о проездах в события, упорядоченные по времени
+
+    Записи должны идти по видео и времени кадра. Проезд, разрезанный границей
+    заданий, склеивается в одно событие, потому что записи обоих заданий
+    оказываются рядом во времени.
+    """
+    events = []
+    open_events = {}
+    for sighting in sightings:
+        key = (sighting['source'], sighting['number'])
+        event = open_events.get(key)
+        if event is None or sighting['media_ms'] - event['last_media_ms'] > event_gap * 1000:
+            event = {
+                'number': sighting['number'],
+                'source': sighting['source'],
+                'first_ts': sighting['ts'],
+                'last_ts': sighting['ts'],
+                'first_media_ms': sighting['media_ms'],
+                'last_media_ms': sighting['media_ms'],
+                'confidence': sighting['confidence'],
+                'sightings': 0,
+            }
+            open_events[key] = event
+            events.append(event)
+        event['last_ts'] = sighting['ts']
+        event['last_media_ms'] = sighting['media_ms']
+        event['confidence'] = max(event['confidence'], sighting['confidence'])
+        event['sightings'] += 1
+
+    events.sort(key=lambda event: (event['first_ts'], event['source'], event['first_media_ms']))
+    for event in events:
+        event['timestamp'] = format_timestamp(event['first_ts'])
+    return events
+
+
+def run_coordinator(videos, queue_path="reports/jobs.db", job_seconds=60.0, recording_start=None,
+                    local_workers=0, threads=None, detection_scale=1.0, heartbeat_timeout=30.0,
+                    poll_interval=2.0, db_path="reports/sightings.db", output=None, preload=None,
+                    results_dir="results", max_disk_bytes=2 * 1024 ** 3, quota_interval=30.0):
+    """Координатор: делит видео на задания, ждет их выполнения и собирает результат
+
+    local_workers - сколько обработчиков запустить на этом компьютере; обработчики
+    на других компьютерах подключаются к той же очереди командой worker.
+    preload - загрузить пайплайн один раз в координаторе и породить локальные
+    обработчики через fork: веса и код моделей общие, загрузка не повторяется.
+    По умолчанию включено там, где есть fork (POSIX); без него обработчики
+    загружают модели по очереди, чтобы не занимать память и диск одновременно.
+    max_disk_bytes - общая квота снимков в results_dir для всех обработчиков,
+    проверяется раз в quota_interval секунд.
+    """
+    queue = JobQueue(queue_path, heartbeat_timeout=heartbeat_timeout)
+    batch = uuid.uuid4().hex
+
+    jobs = []
+    for video_path in videos:
+        video_jobs = split_video(video_path, job_seconds, recording_start)
+        print(f"{video_path}: {len(video_jobs)} заданий, начало записи "
+              f"{format_timestamp(video_jobs[0][3])}")
+        jobs.extend(video_jobs)
+    queue.submit(batch, jobs)
+
+    if local_workers and not threads:
+        threads = max((os.cpu_count() or 1) // local_workers, 1)
+    if preload is None:
+        preload = os.name == "posix"
+    elif preload and os.name != "posix":
+        print("Предупреждение: fork недоступен, обработчики загрузят модели сами")
+        preload = False
+    preloaded = None
+    startup_lock = None
+    context = mp.get_context()
+    if local_workers and not preload:
+        startup_lock = context.Lock()
+    elif local_workers:
+        # До fork модели только загружаются: прогон в родителе запустил бы пул потоков OpenMP
+        print("Инициализация системы распознавания для локальных обработчиков...")
+        preloaded = load_pipeline(image_loader=None, shared=True)
+        context = mp.get_context("fork")
+    processes = [context.Process(target=run_worker, kwargs=dict(
+        queue_path=queue_path, worker_id=f"{socket.gethostname()}:local{i}", threads=threads,
+        detection_scale=detection_scale, heartbeat_timeout=heartbeat_timeout,
+        poll_interval=poll_interval, exit_when_idle=True, results_dir=results_dir,
+        number_plate_detection_and_reading=preloaded, startup_lock=startup_lock
+    )) for i in range(local_workers)]
+
+    start_time = time.time()
+    for process in processes:
+        process.start()
+    last_quota_check = time.monotonic()
+
+    try:
+        while True:
+            progress = queue.progress(batch)
+            if progress['pending'] + progress['running'] == 0:
+                break
+            # Задания обработчиков, переставших отмечаться, возвращаются в очередь
+            queue.requeue_stale()
+            if max_disk_bytes and time.monotonic() - last_quota_check >= quota_interval:
+                last_quota_check = time.monotonic()
+                enforce_disk_quota(results_dir, max_disk_bytes)
+            elapsed = time.time() - start_time
+            print(f"Заданий: выполнено {progress['done']}/{len(jobs)}, в работе {progress['running']}, "
+                  f"ошибок {progress['failed']} | кадров: {progress['frames']} | "
+                  f"{progress['frames'] / max(elapsed, 1e-6):.2f} FPS")
+            if processes and not any(process.is_alive() for process in processes):
+                print("Все локальные обработчики завершились, задания остались невыполненными")
+                break
+            time.sleep(poll_interval)
+    finally:
+        for process in processes:
+            process.join()
+    if max_disk_bytes:
+        enforce_disk_quota(results_dir, max_disk_bytes)
+
+    wall_time = time.time() - start_time
+    progress = queue.progress(batch)
+
+    # Записи всех заданий сохраняются в общую историю и собираются в события
+    sighting_store = SightingStore(db_path)
+    sightings = []
+    for sighting in queue.iter_results(batch):
+        sighting_store.add(sighting)
+        sightings.append(sighting)
+    sighting_store.close()
+    events = merge_events(sightings)
+
+    failed = queue.failed_jobs(batch)
+    queue.close()
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(events, f, ensure_ascii=False, indent=2)
+
+    print("\nОбработка завершена:")
+    print(f"Заданий: {progress['done']}/{len(jobs)}, неудачных: {len(failed)}")
+    for job in failed:
+        print(f"  {job['video']} {job['start_ms'] / 1000:.0f}-{job['end_ms'] / 1000:.0f} с: {job['error']}")
+    print(f"Кадров: {progress['frames']} | Общее время: {wall_time:.2f} секунд | "
+          f"Суммарный FPS: {progress['frames'] / max(wall_time, 1e-6):.2f}")
+    print(f"Записей: {len(sightings)} | Событий: {len(events)}")
+    for event in events:
+        print(f"{event['timestamp']}  {event['number']}  (уверенность: {event['confidence']:.2f}, "
+              f"кадров: {event['sightings']})  {event['source']}")
+
+    return {
+        'events': events,
+        'sightings': len(sightings),
+        'frames': progress['frames'],
+        'jobs': len(jobs),
+        'failed': failed,
+        'wall_time': wall_time,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Распределенная обработка архива видео")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+
+    coordinator = subparsers.add_parser("coordinator", help="Разделить видео на задания и собрать результат")
+    coordinator.add_argument("videos", nargs="+", help="Пути к видео (одинаковые для всех обработчиков)")
+    coordinator.add_argument("--job-seconds", type=float, default=60.0, help="Длина отрезка видео в задании")
+    coordinator.add_argument("--workers", type=int, default=0, help="Локальные обработчики на этом компьютере")
+    coordinator.add_argument("--start", default=None,
+                             help="Время начала записи ('ГГГГ-ММ-ДД ЧЧ:ММ:СС' или секунды Unix)")
+    coordinator.add_argument("--output", default=None, help="Сохранить события в JSON")
+    coordinator.add_argument("--preload", action="store_true", default=None,
+                             help="Загрузить модели один раз и запустить локальные обработчики через fork "
+                                  "(по умолчанию в Linux и macOS)")
+    coordinator.add_argument("--no-preload", dest="preload", action="store_false",
+                             help="Каждый локальный обработчик загружает модели сам, по очереди")
+    coordinator.add_argument("--max-disk-gb", type=float, default=2.0,
+                             help="Общая квота снимков в папке results для всех обработчиков")
+
+    worker = subparsers.add_parser("worker", help="Обрабатывать задания из очереди")
+    worker.add_argument("--id", default=None, help="Имя обработчика (по умолчанию компьютер:PID)")
+    worker.add_argument("--exit-when-idle", action="store_true", help="Завершиться, когда заданий не останется")
+    worker.add_argument("--private-weights", action="store_true",
+                        help="Загружать собственную копию весов вместо общего файла")
+
+    for subparser in (coordinator, worker):
+        subparser.add_argument("--queue", default="reports/jobs.db", help="База очереди заданий")
+        subparser.add_argument("--threads", type=int, default=None, help="Потоков torch на обработчик")
+        subparser.add_argument("--detection-scale", type=float, default=1.0)
+        subparser.add_argument("--heartbeat-timeout", type=float, default=30.0,
+                               help="Через сколько секунд без отметок задание возвращается в очередь")
+    args = parser.parse_args()
+
+    if args.mode == "coordinator":
+        run_coordinator(args.videos, args.queue, args.job_seconds,
+                        parse_start_time(args.start) if args.start else None,
+                        args.workers, args.threads, args.detection_scale, args.heartbeat_timeout,
+                        output=args.output, preload=args.preload,
+                        max_disk_bytes=int(args.max_disk_gb * 1024 ** 3))
+    else:
+        run_worker(args.queue, args.id, args.threads, args.detection_scale,
+                   heartbeat_timeout=args.heartbeat_timeout, exit_when_idle=args.exit_when_idle,
+                   shared_weights=not args.private_weights)
@@ -0,0 +1,295 @@
+import gzip
+import hashlib
+import json
+import os
+import queue
+import random
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def make_event_id(site_id, event):
+    """Постоянный идентификатор события: повторная отправка не создает дубликат на сервере"""
+    key = "|".join([
+        site_id,
+        str(event.get('source') or ""),
+        f"{float(event.get('ts') or 0):.3f}",
+        str(event.get('number') or ""),
+    ])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+
+
+def encode_batch(events, compression):
+    """Пакет событий в JSONL, сжатый zstd или gzip"""
+    data = "".join(json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n"
+                   for event in events).encode("utf-8")
+    if compression == "zstd":
+        return data, zstandard.ZstdCompressor(level=3).compress(data)
+    return data, gzip.compress(data, compresslevel=6)
+
+
+def decode_batch(body, encoding):
+    """Обратное преобразование для принимающей стороны"""
+    if encoding == "zstd":
+        data = zstandard.ZstdDecompressor().decompress(body, max_output_size=64 * 1024 ** 2)
+    elif encoding == "gzip":
+        data = gzip.decompress(body)
+    else:
+        data = body
+    return [json.loads(line) for line in data.decode("utf-8").splitlines() if line.strip()]
+
+
+class EventUplink:
+    """Отправка событий распознавания на центральный сервер с буфером на диске
+
+    publish() только кладет событие в очередь и никогда не ждет сеть. Фоновый
+    поток собирает события в пакеты, сжимает и сохраняет пакет в папку spool_dir;
+    отдельный поток отправляет сохраненные пакеты по порядку, поэтому зависший
+    запрос не задерживает прием и сохранение событий. Пока сервер
+    недоступен, пакеты копятся на диске (с квотой) и отправляются с растущей
+    паузой между попытками; после перезапуска отправка продолжается.
+    """
+
+    def __init__(self, url, spool_dir="reports/uplink", site_id=None, batch_size=200,
+                 flush_interval=2.0, queue_size=10000, timeout=10.0, min_backoff=1.0,
+                 max_backoff=300.0, max_spool_bytes=512 * 1024 ** 2, compression=None):
+        if compression is None:
+            compression = "zstd" if zstandard is not None else "gzip"
+        if compression not in ("zstd", "gzip"):
+            raise ValueError(f"Неизвестное сжатие: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("Для сжатия zstd нужен пакет zstandard")
+
+        self.url = url
+        self.spool_dir = spool_dir
+        self.site_id = site_id or socket.gethostname()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.max_spool_bytes = max_spool_bytes
+        self.compression = compression
+        self.extension = ".jsonl.zst" if compression == "zstd" else ".jsonl.gz"
+
+        self.rejected_dir = os.path.join(spool_dir, "rejected")
+        for directory in (spool_dir, self.rejected_dir):
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+
+        # Объем буфера на диске ведется в памяти: каталог пересчитывается только при превышении квоты
+        self.spool_lock = threading.Lock()
+        self.spool_bytes = sum(os.path.getsize(path) for path in self._spooled())
+
+        self.sequence = 0
+        self.backoff = 0.0
+        self.next_attempt = 0.0
+        self.online = None
+        self.last_error = None
+
+        self.sent_batches = 0
+        self.sent_events = 0
+        self.dropped_events = 0
+        self.dropped_batches = 0
+        self.rejected_batches = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        # Будит поток отправки, когда на диске появился новый пакет
+        self.spooled_event = threading.Event()
+        self.spool_thread = threading.Thread(target=self._spool_worker, name="event-uplink-spool", daemon=True)
+        self.send_thread = threading.Thread(target=self._send_worker, name="event-uplink-send", daemon=True)
+        self.spool_thread.start()
+        self.send_thread.start()
+
+    def publish(self, event):
+        """Ставит событие в очередь на отправку, возвращает False если очередь переполнена"""
+        event = dict(event)
+        event['site'] = self.site_id
+        event.setdefault('event_id', make_event_id(self.site_id, event))
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.dropped_events += 1
+            return False
+
+    def _spooled(self):
+        """Сохраненные пакеты от старых к новым (имя начинается со времени создания)"""
+        names = [name for name in os.listdir(self.spool_dir)
+                 if name.endswith((".jsonl.gz", ".jsonl.zst"))]
+        return [os.path.join(self.spool_dir, name) for name in sorted(names)]
+
+    def _spool(self, events):
+        """Сжимает пакет и атомарно сохраняет его на диск"""
+        raw, body = encode_batch(events, self.compression)
+        self.raw_bytes += len(raw)
+        self.compressed_bytes += len(body)
+
+        self.sequence += 1
+        name = f"{time.time_ns()}_{self.sequence:06d}_{len(events)}{self.extension}"
+        path = os.path.join(self.spool_dir, name)
+        with open(path + ".part", "wb") as f:
+            f.write(body)
+        os.replace(path + ".part", path)
+
+        with self.spool_lock:
+            self.spool_bytes += len(body)
+            if self.spool_bytes <= self.max_spool_bytes:
+                return
+            # При долгом отсутствии связи вытесняем самые старые пакеты
+            spooled = self._spooled()
+            sizes = [os.path.getsize(p) for p in spooled]
+            total = sum(sizes)
+            for old_path, size in zip(spooled[:-1], sizes[:-1]):
+                if total <= self.max_spool_bytes:
+                    break
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    # Пакет только что отправлен
+                    pass
+                total -= size
+                self.dropped_batches += 1
+            self.spool_bytes = total
+
+    def _send(self, path):
+        """Отправляет один пакет: "sent", "retry" или "rejected" (сервер не примет его никогда)"""
+        with open(path, "rb") as f:
+            body = f.read()
+        name = os.path.basename(path)
+        request = urllib.request.Request(self.url, data=body, method="POST", headers={
+            'Content-Type': "application/x-ndjson",
+            'Content-Encoding': "zstd" if name.endswith(".zst") else "gzip",
+            'X-Batch-Id': name.split(".")[0],
+            'X-Site-Id': self.site_id,
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+            return "sent"
+        except urllib.error.HTTPError as e:
+            self.last_error = f"HTTP {e.code}"
+            # Ошибки клиента кроме тайм-аута и ограничения частоты повторять бессмысленно
+            if 400 <= e.code < 500 and e.code not in (408, 429):
+                return "rejected"
+            return "retry"
+        except (urllib.error.URLError, OSError) as e:
+            self.last_error = str(getattr(e, 'reason', e))
+            return "retry"
+
+    def _send_spooled(self):
+        """Отправляет сохраненные пакеты, пока сервер отвечает; при ошибке ждет с растущей паузой"""
+        if time.monotonic() < self.next_attempt:
+            return
+        for path in self._spooled():
+            try:
+                result = self._send(path)
+            except FileNotFoundError:
+                # Пакет вытеснен по квоте, пока очередь дошла до него
+                continue
+            if result == "retry":
+                self.online = False
+                self.backoff = min(max(self.backoff * 2, self.min_backoff), self.max_backoff)
+                # Случайный разброс, чтобы площадки не приходили к серверу одновременно
+                self.next_attempt = time.monotonic() + self.backoff * random.uniform(0.5, 1.0)
+                return
+
+            self.online = True
+            self.backoff = 0.0
+            try:
+                size = os.path.getsize(path)
+                if result == "sent":
+                    self.sent_batches += 1
+                    self.sent_events += int(os.path.basename(path).split(".")[0].split("_")[2])
+                    os.remove(path)
+                else:
+                    self.rejected_batches += 1
+                    os.replace(path, os.path.join(self.rejected_dir, os.path.basename(path)))
+            except FileNotFoundError:
+                continue
+            with self.spool_lock:
+                self.spool_bytes = max(self.spool_bytes - size, 0)
+
+    def _spool_worker(self):
+        """Поток приема: собирает события в пакеты и сохраняет их на диск, сеть не трогает"""
+        pending = []
+        first_time = None
+        while True:
+            try:
+                event = self.queue.get(timeout=0.2)
+                pending.append(event)
+                if first_time is None:
+                    first_time = time.monotonic()
+            except queue.Empty:
+                pass
+
+            stopping = self.stop_event.is_set() and self.queue.empty()
+            try:
+                if pending and (len(pending) >= self.batch_size or stopping or
+                                time.monotonic() - first_time >= self.flush_interval):
+                    self._spool(pending)
+                    pending = []
+                    first_time = None
+                    self.spooled_event.set()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Ошибка сохранения событий: {str(e)}")
+            if stopping:
+                break
+
+    def _send_worker(self):
+        """Поток отправки: передает сохраненные пакеты на сервер"""
+        while True:
+            stopping = self.stop_event.is_set() and not self.spool_thread.is_alive()
+            try:
+                self._send_spooled()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Ошибка отправки событий: {str(e)}")
+            if stopping:
+                break
+            # Ждем новый пакет, конца паузы после ошибки или остановки
+            wait = min(max(self.next_attempt - time.monotonic(), 0.05), 1.0)
+            self.spooled_event.wait(wait)
+            self.spooled_event.clear()
+
+    def stats(self):
+        """Возвращает статистику отправки"""
+        spooled = self._spooled()
+        return {
+            'queued': self.queue.qsize(),
+            'spooled_batches': len(spooled),
+            'spool_bytes': self.spool_bytes,
+            'sent_batches': self.sent_batches,
+            'sent_events': self.sent_events,
+            'dropped_events': self.dropped_events,
+            'dropped_batches': self.dropped_batches,
+            'rejected_batches': self.rejected_batches,
+            'compression_ratio': self.raw_bytes / self.compressed_bytes if self.compressed_bytes else 0.0,
+            'online': self.online,
+            'backoff': self.backoff,
+            'last_error': self.last_error,
+        }
+
+    def close(self, timeout=5.0):
+        """Сохраняет очередь на диск и делает последнюю попытку отправки, не дольше timeout
+
+        Сохранение на диск от сети не зависит, его дожидаемся всегда; неотправленные
+        пакеты уйдут после следующего запуска.
+        """
+        deadline = time.monotonic() + timeout
+        self.stop_event.set()
+        self.spool_thread.join()
+        self.spooled_event.set()
+        self.send_thread.join(max(deadline - time.monotonic(), 0))
@@ -0,0 +1,255 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+
+
+def enforce_disk_quota(directory, max_disk_bytes):
+    """Удаляет самые старые снимки в папке и ее подпапках, пока их объем больше квоты
+
+    Нужна, когда в одну папку пишут несколько процессов: у каждого EvidenceWriter
+    своя квота, и общий объем они не видят. Возвращает число удаленных файлов.
+    """
+    files = []
+    total = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if not name.lower().endswith(".jpg"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, path, stat.st_size))
+            total += stat.st_size
+
+    removed = 0
+    for _, path, size in sorted(files):
+        if total <= max_disk_bytes:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+        total -= size
+    return removed
+
+
+class EvidenceWriter:
+    """Фоновая запись доказательных снимков с ограниченной очередью и квотой на диск"""
+
+    def __init__(self, output_dir="results", workers=2, queue_size=32,
+                 jpeg_quality=90, drop_policy="block", max_disk_bytes=2 * 1024 ** 3,
+                 event_gap=2.0, thumbnail_padding=10):
+        # drop_policy: "block" - ждем освобождения очереди (backpressure),
+        # "drop" - отбрасываем новый снимок, если диск не успевает
+        if drop_policy not in ("block", "drop"):
+            raise ValueError(f"Неизвестная политика переполнения: {drop_policy}")
+
+        self.output_dir = output_dir
+        self.jpeg_quality = jpeg_quality
+        self.drop_policy = drop_policy
+        self.max_disk_bytes = max_disk_bytes
+        self.event_gap = event_gap
+        self.thumbnail_padding = thumbnail_padding
+
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        # Открытые события: номер -> лучший кадр за время проезда
+        self.open_events = {}
+
+        # Учет занятого места для вытеснения самых старых файлов
+        self.written_files = deque()
+        self.disk_usage = 0
+        self.disk_lock = threading.Lock()
+        self._scan_existing_files()
+
+        self.written_count = 0
+        self.dropped_count = 0
+        self.evicted_count = 0
+        self.written_bytes = 0
+        self.cpu_seconds = 0.0
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"evidence-writer-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _scan_existing_files(self):
+        """Учитывает файлы, оставшиеся от предыдущих запусков"""
+        existing = []
+        for name in os.listdir(self.output_dir):
+            if not name.lower().endswith(".jpg"):
+                continue
+            path = os.path.join(self.output_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            existing.append((stat.st_mtime, path, stat.st_size))
+
+        for _, path, size in sorted(existing):
+            self.written_files.append((path, size))
+            self.disk_usage += size
+
+    def submit(self, path, image, quota=True):
+        """Ставит изображение в очередь на запись, возвращает False если оно отброшено
+
+        quota=False - файл вне results (например, снимок к отчету): он не учитывается
+        в квоте и никогда не вытесняется.
+        """
+        item = (path, image, quota)
+        if self.drop_policy == "block":
+            self.queue.put(item)
+            return True
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped_count += 1
+            return False
+
+    def offer(self, number, confidence, frame, bbox, timestamp=None):
+        """Учитывает наблюдение номера; кадр копируется только если он лучше текущего"""
+        if timestamp is None:
+            timestamp = time.time()
+
+        event = self.open_events.get(number)
+        if event is None:
+            event = {'number': number, 'confidence': -1.0,
+                     'first_seen': timestamp, 'last_seen': timestamp,
+                     'frame': None, 'bbox': None, 'best_time': timestamp}
+            self.open_events[number] = event
+
+        event['last_seen'] = timestamp
+        if confidence > event['confidence']:
+            event['confidence'] = confidence
+            event['frame'] = frame.copy()
+            event['bbox'] = bbox
+            event['best_time'] = timestamp
+
+    def discard(self):
+        """Отбрасывает открытые события без записи (например, задание передано другому)"""
+        self.open_events.clear()
+
+    def expire(self, timestamp=None):
+        """Закрывает события, номер которых не появлялся дольше event_gap секунд"""
+        if timestamp is None:
+            timestamp = time.time()
+
+        finished = [number for number, event in self.open_events.items()
+                    if timestamp - event['last_seen'] > self.event_gap]
+        for number in finished:
+            self._flush_event(self.open_events.pop(number))
+        return len(finished)
+
+    def _flush_event(self, event):
+        """Отправляет на запись лучший кадр события и вырезанный номер"""
+        if event['frame'] is None:
+            return
+
+        frame = event['frame']
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(event['best_time']))
+        millis = int((event['best_time'] % 1) * 1000)
+        safe_number = event['number'].replace(' ', '')
+        base_name = f"{stamp}_{millis:03d}_{safe_number}"
+
+        self.submit(os.path.join(self.output_dir, f"event_{base_name}.jpg"), frame)
+
+        if event['bbox'] is not None:
+            thumbnail = self._crop(frame, event['bbox'])
+            if thumbnail is not None:
+                self.submit(os.path.join(self.output_dir, f"plate_{base_name}.jpg"), thumbnail)
+
+    def _crop(self, frame, bbox):
+        """Вырезает область номера с небольшим отступом"""
+        h, w = frame.shape[:2]
+        pad = self.thumbnail_padding
+        x1 = max(int(bbox[0]) - pad, 0)
+        y1 = max(int(bbox[1]) - pad, 0)
+        x2 = min(int(bbox[2]) + pad, w)
+        y2 = min(int(bbox[3]) + pad, h)
+        if x2 <= x1 or y2 <= y1:
+            return None
+        return frame[y1:y2, x1:x2].copy()
+
+    def _worker(self):
+        """Поток записи: кодирует JPEG и следит за квотой"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+
+            path, image, quota = item
+            cpu_start = time.thread_time()
+            try:
+                params = [cv2.IMWRITE_JPEG_QUALITY, int(self.jpeg_quality)]
+                ok, buffer = cv2.imencode(".jpg", image, params)
+                if ok:
+                    with open(path, "wb") as f:
+                        f.write(buffer.tobytes())
+                    self._account(path, len(buffer), quota)
+                else:
+                    print(f"Ошибка кодирования снимка {path}")
+            except Exception as e:
+                print(f"Ошибка при записи снимка {path}: {str(e)}")
+            finally:
+                self._account_cpu(time.thread_time() - cpu_start)
+                self.queue.task_done()
+
+    def _account(self, path, size, quota=True):
+        """Учитывает записанный файл и удаляет самые старые при превышении квоты"""
+        with self.disk_lock:
+            self.written_count += 1
+            self.written_bytes += size
+            if not quota:
+                return
+            self.written_files.append((path, size))
+            self.disk_usage += size
+
+            while self.max_disk_bytes and self.disk_usage > self.max_disk_bytes and len(self.written_files) > 1:
+                old_path, old_size = self.written_files.popleft()
+                self.disk_usage -= old_size
+                try:
+                    os.remove(old_path)
+                    self.evicted_count += 1
+                except OSError:
+                    pass
+
+    def _account_cpu(self, seconds):
+        with self.disk_lock:
+            self.cpu_seconds += seconds
+
+    def stats(self):
+        """Возвращает статистику записи"""
+        return {
+            'queued': self.queue.qsize(),
+            'open_events': len(self.open_events),
+            'written': self.written_count,
+            'dropped': self.dropped_count,
+            'evicted': self.evicted_count,
+            'disk_usage': self.disk_usage,
+            'written_bytes': self.written_bytes,
+            'cpu_seconds': self.cpu_seconds,
+        }
+
+    def close(self):
+        """Сбрасывает открытые события и дожидается окончания записи"""
+        for event in list(self.open_events.values()):
+            self._flush_event(event)
+        self.open_events.clear()
+
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
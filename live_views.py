@@ -0,0 +1,134 @@
+import logging
+import os
+from collections import OrderedDict, deque
+from logging.handlers import RotatingFileHandler
+
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QTimer
+from PyQt5.QtWidgets import QListView, QPlainTextEdit
+
+
+class RingBufferListModel(QAbstractListModel):
+    """Модель списка фиксированной емкости: старые строки вытесняются новыми"""
+
+    def __init__(self, capacity=1000, parent=None):
+        super().__init__(parent)
+        self.capacity = capacity
+        self.rows = deque()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        return self.rows[index.row()]
+
+    def append_rows(self, items):
+        """Добавляет строки пачкой, удаляя самые старые сверх емкости"""
+        items = list(items)[-self.capacity:]
+        if not items:
+            return
+
+        overflow = len(self.rows) + len(items) - self.capacity
+        if overflow > 0:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            for _ in range(overflow):
+                self.rows.popleft()
+            self.endRemoveRows()
+
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(items) - 1)
+        self.rows.extend(items)
+        self.endInsertRows()
+
+    def move_to_end(self, row):
+        """Переносит строку в конец списка, чтобы она вытеснялась последней"""
+        last = len(self.rows) - 1
+        if row >= last:
+            return
+        self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), len(self.rows))
+        item = self.rows[row]
+        del self.rows[row]
+        self.rows.append(item)
+        self.endMoveRows()
+
+
+class LiveSightingList(QListView):
+    """Список последних уникальных номеров с ограниченной памятью"""
+
+    def __init__(self, capacity=1000, parent=None):
+        super().__init__(parent)
+        self.list_model = RingBufferListModel(capacity, self)
+        self.setModel(self.list_model)
+        # Одинаковая высота строк позволяет не измерять каждую строку при прокрутке
+        self.setUniformItemSizes(True)
+        self.setEditTriggers(QListView.NoEditTriggers)
+        # Номера, показанные в списке, в том же порядке, что и строки модели;
+        # при повторном появлении номер не дублируется, а переносится в конец
+        self.recent = OrderedDict()
+
+    def add_number(self, number):
+        """Добавляет номер, если его нет среди последних показанных; возвращает True для нового"""
+        if number in self.recent:
+            self.recent.move_to_end(number)
+            self.list_model.move_to_end(self.list_model.rows.index(number))
+            self.scrollToBottom()
+            return False
+
+        self.recent[number] = True
+        self.list_model.append_rows([number])
+        # Вытеснение задает модель: из recent уходят номера удаленных строк
+        while len(self.recent) > len(self.list_model.rows):
+            self.recent.popitem(last=False)
+        self.scrollToBottom()
+        return True
+
+    def unique_count(self):
+        return len(self.recent)
+
+
+class BatchedLogView(QPlainTextEdit):
+    """Лог, который обновляется пачками раз в такт интерфейса
+
+    Виджет хранит только последние max_lines строк, полная история
+    пишется в файл с ротацией.
+    """
+
+    def __init__(self, max_lines=1000, interval_ms=200, log_path="reports/gui.log", parent=None):
+        super().__init__(parent)
+        self.setReadOnly(True)
+        self.setMaximumBlockCount(max_lines)
+        self.pending = []
+
+        directory = os.path.dirname(log_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.file_logger = logging.getLogger("video_recognition_gui")
+        self.file_logger.setLevel(logging.INFO)
+        self.file_logger.propagate = False
+        if not self.file_logger.handlers:
+            handler = RotatingFileHandler(log_path, maxBytes=10 * 1024 ** 2,
+                                          backupCount=5, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.file_logger.addHandler(handler)
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.timeout.connect(self.flush)
+        self.flush_timer.start(interval_ms)
+
+    def append_message(self, message):
+        """Запоминает сообщение до следующего такта, не трогая документ"""
+        self.pending.append(message)
+        self.file_logger.info(message)
+
+    def flush(self):
+        """Выводит накопленные сообщения одной вставкой и прокручивает лог один раз"""
+        if not self.pending:
+            return
+        text = "\n".join(self.pending[-self.maximumBlockCount():])
+        self.pending = []
+        self.appendPlainText(text)
+        scroll_bar = self.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.maximum())
@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+
+
+class DownscaledLocalization:
+    """Обертка над этапом поиска номеров: детектор получает уменьшенную копию кадра
+
+    Найденные рамки переводятся обратно в координаты исходного кадра, поэтому
+    ключевые точки, исправление перспективы и OCR работают с полным разрешением.
+    """
+
+    def __init__(self, localization, scale=0.5, min_width=640):
+        self.localization = localization
+        self.scale = scale
+        # Кадры, которые после уменьшения стали бы уже min_width, не уменьшаем
+        self.min_width = min_width
+
+    def __getattr__(self, name):
+        return getattr(self.localization, name)
+
+    def _image_scale(self, image):
+        width = image.shape[1]
+        scale = max(self.scale, self.min_width / width) if width else 1.0
+        return min(scale, 1.0)
+
+    def _downscale(self, images):
+        small_images = []
+        scales = []
+        for image in images:
+            scale = self._image_scale(image)
+            if scale < 1.0:
+                image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            small_images.append(image)
+            scales.append(scale)
+        return small_images, scales
+
+    @staticmethod
+    def _scale_boxes(boxes, scale):
+        """Переводит рамки [x1, y1, x2, y2, уверенность, класс] в координаты исходного кадра
+
+        Другие столбцы (например, ключевые точки) пересчитать нельзя, не зная их
+        раскладки, поэтому такие рамки отклоняются, а не возвращаются наполовину
+        пересчитанными.
+        """
+        if scale == 1.0 or boxes is None or len(boxes) == 0:
+            return boxes
+        scaled = np.array(boxes, dtype=np.float64, copy=True)
+        if scaled.ndim != 2 or not 4 <= scaled.shape[1] <= 6:
+            raise ValueError(f"Неожиданный формат рамок детектора {scaled.shape}: ожидались столбцы "
+                             f"[x1, y1, x2, y2, уверенность, класс]; используйте detection_scale 1.0")
+        scaled[:, :4] /= scale
+        return scaled.tolist() if isinstance(boxes, list) else scaled
+
+    def _restore(self, outputs, images, scales):
+        restored = []
+        for output, image, scale in zip(outputs, images, scales):
+            # Некоторые версии возвращают пары (рамки, изображение) - подставляем исходный кадр
+            if (isinstance(output, (tuple, list)) and len(output) == 2 and
+                    isinstance(output[1], np.ndarray) and output[1].ndim == 3):
+                restored.append(type(output)((self._scale_boxes(output[0], scale), image)))
+            else:
+                restored.append(self._scale_boxes(output, scale))
+        return restored
+
+    def call(self, images, **kwargs):
+        small_images, scales = self._downscale(images)
+        outputs = self.localization.call(small_images, **kwargs)
+        return self._restore(outputs, images, scales)
+
+    def __call__(self, images, **kwargs):
+        small_images, scales = self._downscale(images)
+        outputs = self.localization(small_images, **kwargs)
+        return self._restore(outputs, images, scales)
+
+
+def set_detection_scale(number_plate_detection_and_reading, scale, min_width=640):
+    """Включает детекцию на уменьшенном кадре (scale < 1) или возвращает полное разрешение (scale = 1)"""
+    localization = number_plate_detection_and_reading.number_plate_localization
+    if isinstance(localization, DownscaledLocalization):
+        localization = localization.localization
+
+    if scale >= 1.0:
+        number_plate_detection_and_reading.number_plate_localization = localization
+    else:
+        number_plate_detection_and_reading.number_plate_localization = DownscaledLocalization(
+            localization, scale, min_width
+        )
@@ -0,0 +1,207 @@
+import csv
+import os
+import threading
+import time
+
+# Словарь соответствия латинских букв кириллическим
+LATIN_TO_CYRILLIC = {
+    'A': 'А', 'B': 'В', 'E': 'Е', 'K': 'К', 'M': 'М',
+    'H': 'Н', 'O': 'О', 'P': 'Р', 'C': 'С', 'T': 'Т',
+    'U': 'У', 'X': 'Х', 'Y': 'У'
+}
+
+
+def normalize_plate(text):
+    """Приводит номер к виду для сравнения: без пробелов, верхний регистр, кириллица"""
+    text = text.replace(' ', '').replace('-', '').upper()
+    return ''.join(LATIN_TO_CYRILLIC.get(char, char) for char in text)
+
+
+def edit_distance(a, b, max_distance=1):
+    """Расстояние Левенштейна с ранним выходом, если оно больше max_distance"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + (char_a != char_b)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def single_deletions(text):
+    """Все варианты строки с одним удаленным символом"""
+    return {text[:i] + text[i + 1:] for i in range(len(text))}
+
+
+class DeletionIndex:
+    """Индекс удалений для поиска номеров на расстоянии одной ошибки OCR
+
+    Для каждого номера хранятся все варианты с одним удаленным символом.
+    Замена, вставка или удаление символа в запросе дают общий ключ
+    с исходным номером, поэтому поиск сводится к нескольким обращениям к словарю.
+    """
+
+    def __init__(self, plates=()):
+        self.plates = set()
+        self.deletions = {}
+        for plate in plates:
+            self.add(plate)
+
+    def __len__(self):
+        return len(self.plates)
+
+    def add(self, plate):
+        if plate in self.plates:
+            return
+        self.plates.add(plate)
+        for key in single_deletions(plate):
+            self.deletions.setdefault(key, []).append(plate)
+
+    def candidates(self, query):
+        """Номера, которые могут отличаться от запроса не более чем на одну правку"""
+        found = set()
+        # Номер длиннее запроса на символ
+        found.update(self.deletions.get(query, ()))
+        for key in single_deletions(query):
+            # Номер короче запроса на символ
+            if key in self.plates:
+                found.add(key)
+            # Замена одного символа
+            found.update(self.deletions.get(key, ()))
+        return found
+
+    def lookup(self, query, max_distance=1):
+        """Возвращает список (номер, расстояние), отсортированный по расстоянию"""
+        if query in self.plates:
+            return [(query, 0)]
+        if max_distance < 1:
+            return []
+
+        matches = []
+        for plate in self.candidates(query):
+            distance = edit_distance(query, plate, max_distance)
+            if distance <= max_distance:
+                matches.append((plate, distance))
+        matches.sort(key=lambda item: (item[1], item[0]))
+        return matches
+
+
+class PlateList:
+    """Список номеров из CSV-файла с автоматической перезагрузкой при изменении"""
+
+    def __init__(self, name, path, check_interval=2.0):
+        self.name = name
+        self.path = path
+        self.check_interval = check_interval
+        self.index = DeletionIndex()
+        self.comments = {}
+        self.mtime = None
+        self.last_check = 0.0
+        self.lock = threading.Lock()
+        self.reload()
+
+    def __len__(self):
+        return len(self.index)
+
+    def reload(self):
+        """Перечитывает файл; новый индекс подменяет старый целиком"""
+        if not os.path.exists(self.path):
+            self.index, self.comments, self.mtime = DeletionIndex(), {}, None
+            return False
+
+        mtime = os.path.getmtime(self.path)
+        index = DeletionIndex()
+        comments = {}
+        with open(self.path, newline='', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                if not row or not row[0].strip() or row[0].startswith('#'):
+                    continue
+                # Пропускаем строку заголовка
+                if row[0].strip().lower() in ('number', 'plate', 'номер'):
+                    continue
+                plate = normalize_plate(row[0].strip())
+                index.add(plate)
+                if len(row) > 1 and row[1].strip():
+                    comments[plate] = row[1].strip()
+
+        self.index, self.comments, self.mtime = index, comments, mtime
+        print(f"Загружен список '{self.name}': {len(index)} номеров из {self.path}")
+        return True
+
+    def maybe_reload(self):
+        """Проверяет время изменения файла не чаще, чем раз в check_interval секунд"""
+        now = time.monotonic()
+        if now - self.last_check < self.check_interval:
+            return False
+        self.last_check = now
+
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime == self.mtime:
+            return False
+
+        with self.lock:
+            if mtime == self.mtime:
+                return False
+            try:
+                return self.reload()
+            except Exception as e:
+                print(f"Ошибка при перезагрузке списка {self.path}: {str(e)}")
+                return False
+
+    def lookup(self, plate, max_distance=1):
+        self.maybe_reload()
+        return self.index.lookup(plate, max_distance)
+
+
+class PlateMatcher:
+    """Проверка номера по черному и белому спискам
+
+    Точное совпадение важнее нечеткого, при равном расстоянии приоритет у черного списка.
+    """
+
+    def __init__(self, allow_path="lists/allow.csv", deny_path="lists/deny.csv",
+                 max_distance=1, check_interval=2.0):
+        self.max_distance = max_distance
+        self.lists = [
+            PlateList("deny", deny_path, check_interval),
+            PlateList("allow", allow_path, check_interval),
+        ]
+
+    def match(self, number):
+        """Возвращает результат сверки номера для записи в событие"""
+        plate = normalize_plate(number)
+        start_time = time.perf_counter()
+
+        result = {'status': 'unknown', 'list': None, 'matched': None,
+                  'distance': None, 'ambiguous': False, 'comment': None}
+        for plate_list in self.lists:
+            matches = plate_list.lookup(plate, self.max_distance)
+            if not matches:
+                continue
+            matched, distance = matches[0]
+            # Точное совпадение из следующего списка важнее нечеткого из текущего
+            if result['list'] is not None and result['distance'] <= distance:
+                continue
+            result.update({
+                'status': plate_list.name,
+                'list': plate_list.name,
+                'matched': matched,
+                'distance': distance,
+                'ambiguous': len(matches) > 1 and matches[1][1] == distance,
+                'comment': plate_list.comments.get(matched),
+            })
+            if distance == 0:
+                break
+
+        result['lookup_us'] = (time.perf_counter() - start_time) * 1e6
+        return result
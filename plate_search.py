@@ -0,0 +1,384 @@
+import argparse
+import fnmatch
+import os
+import pickle
+import re
+import sqlite3
+import time
+import zlib
+
+import numpy as np
+
+from plate_matching import edit_distance, normalize_plate, single_deletions
+
+# Ключ записи: номер в старших битах, миллисекунды от начала истории в младших,
+# поэтому записи одного номера лежат подряд и упорядочены по времени
+TIME_BITS = 40
+TIME_MASK = (1 << TIME_BITS) - 1
+# Больше номеров в знаковый int64 не поместится: старшие биты ключа переполнятся
+MAX_PLATES = 1 << (63 - TIME_BITS)
+# Версия формата сохраненного индекса: при изменении структуры старый файл перестраивается
+INDEX_VERSION = 1
+
+
+def deletion_hashes(plate):
+    """Хэши номера и его вариантов без одного символа для нечеткого поиска
+
+    Номера на расстоянии одной правки всегда имеют общий вариант. Хэш crc32
+    не зависит от запуска, поэтому массивы хэшей можно сохранять в файл;
+    редкие совпадения хэшей отсеиваются проверкой расстояния.
+    """
+    keys = single_deletions(plate)
+    keys.add(plate)
+    return [zlib.crc32(key.encode("utf-8")) for key in keys]
+
+
+def parse_pattern(pattern):
+    """Разбирает шаблон с '?' (один символ) и '*' (любая последовательность)
+
+    Возвращает префикс до первой '*', суффикс после последней '*',
+    фрагменты между ними и признак наличия '*'.
+    """
+    if '*' not in pattern:
+        return pattern, '', [], False
+    parts = pattern.split('*')
+    return parts[0], parts[-1], [part for part in parts[1:-1] if part], True
+
+
+class PlateSearchIndex:
+    """Индекс истории распознаваний для поиска по части номера
+
+    Уникальные номера индексируются по позициям символов от начала и от конца
+    номера, а также по триграммам для фрагментов в середине. Записи о проездах
+    хранятся в массиве numpy ключей (номер, время), поэтому фильтр по времени
+    сразу для всех найденных номеров - это один векторный бинарный поиск.
+    Новые записи базы добавляются к индексу без перестройки, сам индекс
+    сохраняется в файл рядом с базой (см. open_index).
+    """
+
+    def __init__(self):
+        self.plates = []
+        self.plate_ids = {}
+        self.cameras = []
+        self.camera_ids = {}
+        self.prefix_index = {}
+        self.suffix_index = {}
+        self.length_index = {}
+        self.trigram_index = {}
+        # Индекс удалений в виде отсортированных массивов (хэш варианта, номер):
+        # в отличие от словаря строк он загружается из файла мгновенно
+        self.deletion_keys = np.zeros(0, dtype=np.int64)
+        self.deletion_plates = np.zeros(0, dtype=np.int32)
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.sighting_cameras = np.zeros(0, dtype=np.int32)
+        self.time_origin = 0.0
+        # Последняя учтенная запись базы SightingStore
+        self.last_id = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _plate_id(self, plate):
+        plate_id = self.plate_ids.get(plate)
+        if plate_id is None:
+            plate_id = len(self.plates)
+            self.plate_ids[plate] = plate_id
+            self.plates.append(plate)
+        return plate_id
+
+    def _camera_id(self, camera):
+        camera = camera or ""
+        camera_id = self.camera_ids.get(camera)
+        if camera_id is None:
+            camera_id = len(self.cameras)
+            self.camera_ids[camera] = camera_id
+            self.cameras.append(camera)
+        return camera_id
+
+    @staticmethod
+    def _make_keys(plate_ids, millis):
+        """Упаковывает номер и время в ключи; при переполнении разрядов - ValueError"""
+        if len(plate_ids) and int(plate_ids.max()) >= MAX_PLATES:
+            raise ValueError(f"Слишком много разных номеров для индекса (максимум {MAX_PLATES})")
+        if len(millis) and int(millis.max()) > TIME_MASK:
+            raise ValueError("История записей длиннее, чем помещается в ключ индекса")
+        return (plate_ids << TIME_BITS) | millis
+
+    def build(self, plate_ids, times, camera_ids):
+        """Строит индекс по массивам записей; номера и камеры уже должны быть зарегистрированы"""
+        plate_ids = np.asarray(plate_ids, dtype=np.int64)
+        times = np.asarray(times, dtype=np.float64)
+        camera_ids = np.asarray(camera_ids, dtype=np.int32)
+
+        self.time_origin = float(times.min()) if len(times) else 0.0
+        millis = np.round((times - self.time_origin) * 1000).astype(np.int64)
+        keys = self._make_keys(plate_ids, millis)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.sighting_cameras = camera_ids[order]
+
+        self.prefix_index = {}
+        self.suffix_index = {}
+        self.length_index = {}
+        self.trigram_index = {}
+        self.deletion_keys = np.zeros(0, dtype=np.int64)
+        self.deletion_plates = np.zeros(0, dtype=np.int32)
+        self._index_plates(0)
+
+    def _index_plates(self, first_id):
+        """Добавляет в индексы символов номера с идентификаторами от first_id"""
+        prefix, suffix, lengths, trigrams = {}, {}, {}, {}
+        deletion_keys, deletion_plates = [], []
+        for plate_id in range(first_id, len(self.plates)):
+            plate = self.plates[plate_id]
+            for position, char in enumerate(plate):
+                prefix.setdefault((position, char), []).append(plate_id)
+                suffix.setdefault((len(plate) - position, char), []).append(plate_id)
+            lengths.setdefault(len(plate), []).append(plate_id)
+            for trigram in {plate[i:i + 3] for i in range(len(plate) - 2)}:
+                trigrams.setdefault(trigram, []).append(plate_id)
+            hashes = deletion_hashes(plate)
+            deletion_keys.extend(hashes)
+            deletion_plates.extend([plate_id] * len(hashes))
+
+        # Новые идентификаторы больше старых, поэтому массивы остаются отсортированными
+        for index, new in ((self.prefix_index, prefix), (self.suffix_index, suffix),
+                           (self.length_index, lengths), (self.trigram_index, trigrams)):
+            for key, ids in new.items():
+                ids = np.array(ids, dtype=np.int32)
+                old = index.get(key)
+                index[key] = ids if old is None else np.concatenate([old, ids])
+
+        deletion_keys = np.array(deletion_keys, dtype=np.int64)
+        deletion_plates = np.array(deletion_plates, dtype=np.int32)
+        order = np.argsort(deletion_keys, kind='stable')
+        deletion_keys, deletion_plates = deletion_keys[order], deletion_plates[order]
+        positions = np.searchsorted(self.deletion_keys, deletion_keys, side='right')
+        self.deletion_keys = np.insert(self.deletion_keys, positions, deletion_keys)
+        self.deletion_plates = np.insert(self.deletion_plates, positions, deletion_plates)
+
+    def _fuzzy_candidates(self, pattern):
+        """Номера на расстоянии не больше одной правки от запроса, включая его самого"""
+        hashes = np.array(sorted(deletion_hashes(pattern)), dtype=np.int64)
+        lo = np.searchsorted(self.deletion_keys, hashes, side='left')
+        hi = np.searchsorted(self.deletion_keys, hashes, side='right')
+        candidates = set()
+        for start, end in zip(lo.tolist(), hi.tolist()):
+            candidates.update(self.deletion_plates[start:end].tolist())
+        return sorted(plate_id for plate_id in candidates
+                      if edit_distance(pattern, self.plates[plate_id], 1) <= 1)
+
+    def add_sightings(self, plates, times, cameras):
+        """Добавляет записи к построенному индексу без его перестройки"""
+        times = np.asarray(times, dtype=np.float64)
+        if not len(times):
+            return
+        first_id = len(self.plates)
+        new_plates = {plate for plate in plates if plate not in self.plate_ids}
+        if first_id + len(new_plates) > MAX_PLATES:
+            # Проверяем до регистрации, чтобы не оставить номера без записей
+            raise ValueError(f"Слишком много разных номеров для индекса (максимум {MAX_PLATES})")
+        plate_ids = np.array([self._plate_id(plate) for plate in plates], dtype=np.int64)
+        camera_ids = np.array([self._camera_id(camera) for camera in cameras], dtype=np.int32)
+
+        if not len(self.keys) or times.min() < self.time_origin:
+            # Записи старше начала истории (например, обработанный позже архив):
+            # ключи считаются от нового начала, поэтому индекс строится заново
+            old_times = self.time_origin + (self.keys & TIME_MASK) / 1000
+            self.build(np.concatenate([self.keys >> TIME_BITS, plate_ids]),
+                       np.concatenate([old_times, times]),
+                       np.concatenate([self.sighting_cameras, camera_ids]))
+            return
+
+        millis = np.round((times - self.time_origin) * 1000).astype(np.int64)
+        keys = self._make_keys(plate_ids, millis)
+        order = np.argsort(keys, kind='stable')
+        keys, camera_ids = keys[order], camera_ids[order]
+        # Вставка в отсортированный массив - один проход копирования вместо сортировки всей истории
+        positions = np.searchsorted(self.keys, keys, side='right')
+        self.keys = np.insert(self.keys, positions, keys)
+        self.sighting_cameras = np.insert(self.sighting_cameras, positions, camera_ids)
+        self._index_plates(first_id)
+
+    def update_from_store(self, db_path="reports/sightings.db"):
+        """Добавляет записи базы SightingStore, появившиеся после прошлого обновления
+
+        Возвращает число добавленных записей.
+        """
+        connection = sqlite3.connect(db_path)
+        try:
+            rows = connection.execute("SELECT id, plate, ts, source FROM sightings WHERE id > ? ORDER BY id",
+                                      (self.last_id,))
+            ids, plates, times, cameras = [], [], [], []
+            for row_id, plate, ts, source in rows:
+                ids.append(row_id)
+                plates.append(plate)
+                times.append(ts)
+                cameras.append(source)
+        finally:
+            connection.close()
+        if ids:
+            self.add_sightings(plates, times, cameras)
+            self.last_id = ids[-1]
+        return len(ids)
+
+    def build_from_store(self, db_path="reports/sightings.db"):
+        """Загружает все записи из базы SightingStore"""
+        self.update_from_store(db_path)
+
+    def save(self, path):
+        """Сохраняет индекс в файл (атомарно)"""
+        part_path = f"{path}.{os.getpid()}.part"
+        with open(part_path, "wb") as f:
+            pickle.dump((INDEX_VERSION, self), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(part_path, path)
+
+    @staticmethod
+    def load(path):
+        """Индекс из файла или None, если файла нет или он другой версии"""
+        try:
+            with open(path, "rb") as f:
+                version, index = pickle.load(f)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError, AttributeError):
+            return None
+        return index if version == INDEX_VERSION else None
+
+    def _candidates_for_pattern(self, pattern):
+        """Номера, подходящие под шаблон: пересечение позиционных и триграммных списков"""
+        if not pattern.strip('*'):
+            return list(range(len(self.plates)))
+        if '*' not in pattern and '?' not in pattern:
+            return [self.plate_ids[pattern]] if pattern in self.plate_ids else []
+
+        prefix, suffix, fragments, has_star = parse_pattern(pattern)
+        lists = []
+
+        for position, char in enumerate(prefix):
+            if char != '?':
+                lists.append(self.prefix_index.get((position, char), np.zeros(0, dtype=np.int32)))
+        for position, char in enumerate(suffix):
+            if char != '?':
+                key = (len(suffix) - position, char)
+                lists.append(self.suffix_index.get(key, np.zeros(0, dtype=np.int32)))
+        if not has_star:
+            lists.append(self.length_index.get(len(pattern), np.zeros(0, dtype=np.int32)))
+        for fragment in fragments:
+            for piece in fragment.split('?'):
+                for i in range(len(piece) - 2):
+                    lists.append(self.trigram_index.get(piece[i:i + 3], np.zeros(0, dtype=np.int32)))
+
+        if not lists:
+            candidates = np.arange(len(self.plates), dtype=np.int32)
+        else:
+            lists.sort(key=len)
+            candidates = lists[0]
+            for ids in lists[1:]:
+                if len(candidates) == 0:
+                    break
+                candidates = np.intersect1d(candidates, ids, assume_unique=True)
+
+        # Индексы сужают выбор, окончательно проверяем шаблоном
+        regex = re.compile(fnmatch.translate(pattern))
+        return [plate_id for plate_id in candidates.tolist() if regex.match(self.plates[plate_id])]
+
+    def search(self, query, fuzzy=False, since=None, until=None, cameras=None, limit=100):
+        """Ищет проезды по шаблону номера с фильтрами по времени и камерам
+
+        query - номер или шаблон с '?' и '*'; fuzzy - допускать одну ошибку OCR
+        (только для запроса без подстановочных символов). Нечеткий поиск всегда
+        возвращает и соседей на расстоянии одной правки, даже если такой номер есть:
+        проезд мог быть прочитан с ошибкой.
+        """
+        pattern = normalize_plate(query)
+        if fuzzy and not any(char in pattern for char in '?*'):
+            plate_ids = self._fuzzy_candidates(pattern)
+        else:
+            plate_ids = self._candidates_for_pattern(pattern)
+
+        plate_ids = np.asarray(plate_ids, dtype=np.int64)
+
+        # Границы отрезков записей каждого номера с учетом периода
+        since_ms = 0 if since is None else max(int(round((since - self.time_origin) * 1000)), 0)
+        until_ms = TIME_MASK if until is None else int(round((until - self.time_origin) * 1000))
+        if until_ms <= since_ms or len(plate_ids) == 0:
+            return []
+        lo = np.searchsorted(self.keys, (plate_ids << TIME_BITS) | since_ms, side='left')
+        hi = np.searchsorted(self.keys, (plate_ids << TIME_BITS) | min(until_ms, TIME_MASK), side='left')
+
+        counts = hi - lo
+        nonempty = counts > 0
+        lo, counts = lo[nonempty], counts[nonempty]
+        if not len(counts):
+            return []
+        # Склеиваем отрезки в один массив позиций без цикла по номерам
+        positions = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+        if cameras:
+            camera_filter = [self.camera_ids[camera] for camera in cameras if camera in self.camera_ids]
+            positions = positions[np.isin(self.sighting_cameras[positions], camera_filter)]
+
+        # Самые свежие проезды
+        times_ms = self.keys[positions] & TIME_MASK
+        if len(positions) > limit:
+            newest = np.argpartition(times_ms, len(times_ms) - limit)[-limit:]
+            positions, times_ms = positions[newest], times_ms[newest]
+        order = np.argsort(times_ms)[::-1]
+
+        return [{
+            'ts': self.time_origin + int(times_ms[i]) / 1000,
+            'plate': self.plates[int(self.keys[positions[i]] >> TIME_BITS)],
+            'camera': self.cameras[int(self.sighting_cameras[positions[i]])],
+        } for i in order]
+
+
+def open_index(db_path="reports/sightings.db", index_path=None):
+    """Загружает сохраненный индекс, дополняет его новыми записями базы и сохраняет
+
+    Полная перестройка нужна только при первом запуске, смене формата или
+    пересоздании базы.
+    """
+    index_path = index_path or db_path + ".index"
+    index = PlateSearchIndex.load(index_path)
+    if index is not None:
+        connection = sqlite3.connect(db_path)
+        try:
+            max_id = connection.execute("SELECT MAX(id) FROM sightings").fetchone()[0] or 0
+        finally:
+            connection.close()
+        # База пересоздана: идентификаторы начались заново
+        if max_id < index.last_id:
+            index = None
+    if index is None:
+        index = PlateSearchIndex()
+    if index.update_from_store(db_path) or not os.path.exists(index_path):
+        index.save(index_path)
+    return index
+
+
+if __name__ == "__main__":
+    from video_recognition import format_timestamp, parse_start_time
+
+    parser = argparse.ArgumentParser(description="Поиск проездов по части номера")
+    parser.add_argument("query", help="Номер или шаблон: ? - один символ, * - любые символы (А1*77)")
+    parser.add_argument("--fuzzy", action="store_true", help="Допускать одну ошибку распознавания")
+    parser.add_argument("--since", default=None, help="Начало периода 'ГГГГ-ММ-ДД ЧЧ:ММ:СС'")
+    parser.add_argument("--until", default=None, help="Конец периода 'ГГГГ-ММ-ДД ЧЧ:ММ:СС'")
+    parser.add_argument("--camera", action="append", default=None, help="Источник (можно несколько)")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--db", default="reports/sightings.db")
+    parser.add_argument("--index", default=None, help="Файл индекса (по умолчанию рядом с базой)")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    index = open_index(args.db, args.index)
+    print(f"Индекс готов за {time.perf_counter() - start_time:.2f} секунд: "
+          f"{len(index)} записей, {len(index.plates)} номеров")
+
+    start_time = time.perf_counter()
+    results = index.search(args.query, args.fuzzy,
+                           parse_start_time(args.since) if args.since else None,
+                           parse_start_time(args.until) if args.until else None,
+                           args.camera, args.limit)
+    print(f"Найдено: {len(results)} за {(time.perf_counter() - start_time) * 1000:.1f} мс")
+    for result in results:
+        print(f"{format_timestamp(result['ts'])}  {result['plate']}  {result['camera']}")
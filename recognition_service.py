@@ -0,0 +1,464 @@
+import argparse
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from aiohttp import web, WSMsgType
+from nomeroff_net import pipeline
+
+from auto_tuner import load_or_tune
+from camera_discovery import ReconnectingCapture
+from multiscale import set_detection_scale
+from plate_matching import PlateMatcher
+from video_recognition import (recognize_frames, frame_media_ms, format_timestamp,
+                               guess_recording_start, parse_start_time)
+
+
+class ModelHolder:
+    """Загружает пайплайн в фоне и хранит статус загрузки для проверки готовности"""
+
+    def __init__(self, detection_scale=1.0):
+        self.detection_scale = detection_scale
+        self.status = "loading"
+        self.error = None
+        self.load_time = None
+        self.tuning = None
+        self.number_plate_detection_and_reading = None
+
+    def load(self):
+        start_time = time.time()
+        try:
+            print("Инициализация системы распознавания...")
+            self.number_plate_detection_and_reading = pipeline(
+                "number_plate_detection_and_reading",
+                image_loader=None
+            )
+            # Сервис становится готовым только после прогрева моделей
+            set_detection_scale(self.number_plate_detection_and_reading, self.detection_scale)
+            self.tuning = load_or_tune(self.number_plate_detection_and_reading, uses_paths=False)
+            self.load_time = time.time() - start_time
+            self.status = "ready"
+            print(f"Модели загружены за {self.load_time:.2f} секунд")
+        except Exception as e:
+            self.status = "error"
+            self.error = str(e)
+            print(f"Ошибка при загрузке моделей: {str(e)}")
+
+    @property
+    def ready(self):
+        return self.status == "ready"
+
+
+class BatchCoalescer:
+    """Объединяет одиночные запросы в пакеты для единственного общего пайплайна"""
+
+    def __init__(self, models, matcher, max_batch=8, max_wait_ms=20, confidence_threshold=0.05):
+        self.models = models
+        self.matcher = matcher
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.confidence_threshold = confidence_threshold
+        self.queue = asyncio.Queue()
+        # Пайплайн не потокобезопасен, поэтому все пакеты идут через один поток
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self.batches = 0
+        self.frames = 0
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=False)
+
+    async def recognize(self, frame):
+        """Ставит кадр в очередь и ждет результат его пакета"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((frame, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            frames = [frame for frame, _ in batch]
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, recognize_frames, frames,
+                    self.models.number_plate_detection_and_reading,
+                    self.confidence_threshold
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.frames += len(frames)
+            for (_, future), plates in zip(batch, results):
+                for plate in plates:
+                    plate['match'] = self.matcher.match(plate['number'])
+                if not future.done():
+                    future.set_result(plates)
+
+
+class EventHub:
+    """Рассылает события о номерах подписчикам WebSocket и SSE"""
+
+    def __init__(self, loop, queue_size=256):
+        self.loop = loop
+        self.queue_size = queue_size
+        self.subscribers = set()
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, event):
+        """Публикует событие; можно вызывать из любого потока"""
+        self.loop.call_soon_threadsafe(self._publish, event)
+
+    def _publish(self, event):
+        for queue in self.subscribers:
+            # Медленный подписчик теряет самые старые события, а не тормозит остальных
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+
+class CameraStream:
+    """Читает поток камеры в отдельном потоке и отправляет кадры на распознавание"""
+
+    def __init__(self, source, coalescer, hub, loop, every_n=5, recording_start=None):
+        if every_n < 1:
+            raise ValueError(f"every_n должен быть не меньше 1, получено {every_n}")
+        self.source = source
+        self.recording_start = recording_start
+        self.coalescer = coalescer
+        self.hub = hub
+        self.loop = loop
+        self.every_n = every_n
+        self.running = False
+        self.frame_count = 0
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=f"camera-{self.source}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        source = int(self.source) if str(self.source).isdigit() else self.source
+        # Камеры и сетевые потоки переподключаются при обрыве, файл просто заканчивается
+        live = isinstance(source, int) or str(source).startswith(("rtsp://", "http://", "https://"))
+        cap = ReconnectingCapture(source) if live else cv2.VideoCapture(source)
+        if not cap.isOpened():
+            print(f"Ошибка: Не удалось открыть источник {self.source}")
+            self.running = False
+            return
+
+        # Для файла время событий считается по времени кадров, а не по часам обработки
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        if not live and self.recording_start is None:
+            duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps
+            self.recording_start = guess_recording_start(source, duration)
+
+        try:
+            while self.running:
+                ret, frame = cap.read()
+                if not ret:
+                    if not live:
+                        break
+                    time.sleep(0.1)
+                    continue
+                self.frame_count += 1
+                if self.frame_count % self.every_n:
+                    continue
+
+                if live:
+                    media_ms = None
+                    frame_time = time.time()
+                else:
+                    media_ms = frame_media_ms(cap, self.frame_count - 1, fps)
+                    frame_time = self.recording_start + media_ms / 1000
+
+                # Ждем результат, чтобы не накапливать кадры быстрее, чем идет распознавание
+                future = asyncio.run_coroutine_threadsafe(self.coalescer.recognize(frame), self.loop)
+                try:
+                    plates = future.result()
+                except Exception as e:
+                    print(f"Ошибка при обработке кадра {self.source}: {str(e)}")
+                    continue
+
+                for plate in plates:
+                    self.hub.publish({
+                        'source': str(self.source),
+                        'frame': self.frame_count,
+                        'number': plate['number'],
+                        'confidence': plate['confidence'],
+                        'bbox': plate['bbox'],
+                        'match': plate['match'],
+                        'media_ms': media_ms,
+                        'ts': frame_time,
+                        'timestamp': format_timestamp(frame_time)
+                    })
+        finally:
+            cap.release()
+            self.running = False
+
+
+def decode_image(data):
+    """Декодирует загруженное изображение в кадр BGR"""
+    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise web.HTTPBadRequest(text="Не удалось декодировать изображение")
+    return frame
+
+
+async def handle_health(request):
+    models = request.app['models']
+    return web.json_response({'status': 'ok', 'model': models.status})
+
+
+async def handle_ready(request):
+    models = request.app['models']
+    body = {'ready': models.ready, 'model': models.status,
+            'load_time': models.load_time, 'error': models.error}
+    return web.json_response(body, status=200 if models.ready else 503)
+
+
+async def handle_recognize(request):
+    """Распознает одно изображение (тело запроса) или пакет (multipart)"""
+    if not request.app['models'].ready:
+        raise web.HTTPServiceUnavailable(text="Модели еще не загружены")
+
+    frames = []
+    if request.content_type.startswith("multipart/"):
+        reader = await request.multipart()
+        async for part in reader:
+            frames.append(decode_image(await part.read()))
+    else:
+        frames.append(decode_image(await request.read()))
+
+    if not frames:
+        raise web.HTTPBadRequest(text="Нет изображений для распознавания")
+
+    coalescer = request.app['coalescer']
+    results = await asyncio.gather(*(coalescer.recognize(frame) for frame in frames))
+    return web.json_response({'results': [{'plates': plates} for plates in results]})
+
+
+async def handle_websocket(request):
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+
+    hub = request.app['hub']
+    queue = hub.subscribe()
+
+    async def receive():
+        # Читаем входящие сообщения только чтобы заметить закрытие соединения
+        async for msg in ws:
+            if msg.type in (WSMsgType.CLOSE, WSMsgType.ERROR):
+                break
+
+    receiver = asyncio.create_task(receive())
+    try:
+        while not ws.closed and not receiver.done():
+            try:
+                event = await asyncio.wait_for(queue.get(), 1.0)
+            except asyncio.TimeoutError:
+                continue
+            await ws.send_json(event)
+    finally:
+        receiver.cancel()
+        hub.unsubscribe(queue)
+    return ws
+
+
+async def handle_sse(request):
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+    })
+    await response.prepare(request)
+
+    hub = request.app['hub']
+    queue = hub.subscribe()
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), 15.0)
+                payload = json.dumps(event, ensure_ascii=False)
+                await response.write(f"event: plate\ndata: {payload}\n\n".encode("utf-8"))
+            except asyncio.TimeoutError:
+                # Комментарий SSE держит соединение открытым через прокси
+                await response.write(b": keep-alive\n\n")
+    except (ConnectionResetError, asyncio.CancelledError):
+        pass
+    finally:
+        hub.unsubscribe(queue)
+    return response
+
+
+async def handle_list_streams(request):
+    streams = request.app['streams']
+    return web.json_response({'streams': [
+        {'source': source, 'running': stream.running, 'frames': stream.frame_count}
+        for source, stream in streams.items()
+    ]})
+
+
+async def handle_start_stream(request):
+    """Запускает распознавание потока камеры или видеофайла"""
+    if not request.app['models'].ready:
+        raise web.HTTPServiceUnavailable(text="Модели еще не загружены")
+
+    try:
+        body = await request.json()
+    except json.JSONDecodeError as e:
+        raise web.HTTPBadRequest(text=f"Некорректный JSON: {str(e)}")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="Ожидается JSON-объект")
+    source = str(body.get('source', '0'))
+    try:
+        every_n = int(body.get('every_n', request.app['every_n']))
+        if every_n < 1:
+            raise ValueError("every_n должен быть не меньше 1")
+        recording_start = parse_start_time(str(body['start'])) if body.get('start') else None
+    except (TypeError, ValueError) as e:
+        raise web.HTTPBadRequest(text=str(e))
+
+    streams = request.app['streams']
+    if source in streams and streams[source].running:
+        return web.json_response({'source': source, 'running': True})
+
+    stream = CameraStream(source, request.app['coalescer'], request.app['hub'],
+                          asyncio.get_running_loop(), every_n, recording_start)
+    stream.start()
+    streams[source] = stream
+    return web.json_response({'source': source, 'running': True}, status=201)
+
+
+async def handle_stop_stream(request):
+    source = request.match_info['source']
+    stream = request.app['streams'].pop(source, None)
+    if stream is None:
+        raise web.HTTPNotFound(text=f"Поток {source} не найден")
+    stream.stop()
+    return web.json_response({'source': source, 'running': False})
+
+
+async def handle_stats(request):
+    coalescer = request.app['coalescer']
+    batches = coalescer.batches
+    return web.json_response({
+        'batches': batches,
+        'frames': coalescer.frames,
+        'avg_batch': coalescer.frames / batches if batches else 0.0,
+        'queued': coalescer.queue.qsize(),
+        'subscribers': len(request.app['hub'].subscribers),
+    })
+
+
+def create_app(max_batch=None, max_wait_ms=20, every_n=5, cameras=(),
+               allow_list="lists/allow.csv", deny_list="lists/deny.csv", detection_scale=1.0):
+    if every_n < 1:
+        raise ValueError(f"every_n должен быть не меньше 1, получено {every_n}")
+    app = web.Application(client_max_size=32 * 1024 ** 2)
+    app['models'] = ModelHolder(detection_scale)
+    app['matcher'] = PlateMatcher(allow_list, deny_list)
+    app['streams'] = {}
+    app['every_n'] = every_n
+
+    async def on_startup(app):
+        loop = asyncio.get_running_loop()
+        app['hub'] = EventHub(loop)
+        app['coalescer'] = BatchCoalescer(app['models'], app['matcher'], max_batch or 1, max_wait_ms)
+        app['coalescer'].start()
+        # Модели грузятся в фоне, /ready отвечает 503 до окончания загрузки
+        loading = loop.run_in_executor(None, app['models'].load)
+
+        async def start_cameras():
+            await loading
+            if not app['models'].ready:
+                return
+            # Без явного --max-batch используем размер пакета, подобранный для компьютера
+            if max_batch is None:
+                app['coalescer'].max_batch = max(app['models'].tuning['batch_size'], 1)
+            for source in cameras:
+                stream = CameraStream(source, app['coalescer'], app['hub'], loop, every_n)
+                stream.start()
+                app['streams'][str(source)] = stream
+
+        app['camera_starter'] = loop.create_task(start_cameras())
+
+    async def on_cleanup(app):
+        app['camera_starter'].cancel()
+        for stream in app['streams'].values():
+            stream.stop()
+        await app['coalescer'].stop()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+
+    app.router.add_get('/health', handle_health)
+    app.router.add_get('/ready', handle_ready)
+    app.router.add_post('/recognize', handle_recognize)
+    app.router.add_get('/events', handle_sse)
+    app.router.add_get('/ws', handle_websocket)
+    app.router.add_get('/streams', handle_list_streams)
+    app.router.add_post('/streams', handle_start_stream)
+    # Источник может быть URL со слешами: /streams/rtsp://camera/stream1
+    app.router.add_delete('/streams/{source:.*}', handle_stop_stream)
+    app.router.add_get('/stats', handle_stats)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальный сервис распознавания номеров")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch", type=int, default=None,
+                        help="По умолчанию берется из подобранной конфигурации")
+    parser.add_argument("--max-wait-ms", type=int, default=20)
+    parser.add_argument("--every-n", type=int, default=5,
+                        help="Распознавать каждый N-й кадр потоков камер")
+    parser.add_argument("--camera", action="append", default=[],
+                        help="Индекс камеры или URL потока, можно указать несколько раз")
+    parser.add_argument("--allow-list", default="lists/allow.csv")
+    parser.add_argument("--deny-list", default="lists/deny.csv")
+    parser.add_argument("--detection-scale", type=float, default=1.0,
+                        help="Масштаб кадра для детектора номеров (1.0 - полное разрешение)")
+    args = parser.parse_args()
+
+    web.run_app(create_app(args.max_batch, args.max_wait_ms, args.every_n, args.camera,
+                           args.allow_list, args.deny_list, args.detection_scale),
+                host=args.host, port=args.port)
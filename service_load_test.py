@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import time
+
+import numpy as np
+from aiohttp import ClientSession
+
+
+async def worker(session, url, data, count, latencies, errors):
+    """Последовательно отправляет запросы и записывает задержку каждого"""
+    for _ in range(count):
+        start_time = time.perf_counter()
+        try:
+            async with session.post(url, data=data,
+                                    headers={'Content-Type': 'application/octet-stream'}) as response:
+                await response.read()
+                if response.status != 200:
+                    errors.append(response.status)
+                    continue
+        except Exception as e:
+            errors.append(str(e))
+            continue
+        latencies.append(time.perf_counter() - start_time)
+
+
+async def run_load_test(base_url, image_path, concurrency, requests_per_client):
+    with open(image_path, 'rb') as f:
+        data = f.read()
+
+    async with ClientSession() as session:
+        # Ждем, пока сервис загрузит модели
+        print("Ожидание готовности сервиса...")
+        while True:
+            try:
+                async with session.get(f"{base_url}/ready") as response:
+                    if response.status == 200:
+                        break
+            except Exception:
+                pass
+            await asyncio.sleep(1)
+
+        # Прогревочный запрос не учитывается в статистике
+        async with session.post(f"{base_url}/recognize", data=data) as response:
+            await response.read()
+
+        # Счетчики сервиса накопительные: берем разницу до и после этого уровня нагрузки
+        async with session.get(f"{base_url}/stats") as response:
+            before = await response.json()
+
+        latencies = []
+        errors = []
+        start_time = time.perf_counter()
+        await asyncio.gather(*(
+            worker(session, f"{base_url}/recognize", data, requests_per_client, latencies, errors)
+            for _ in range(concurrency)
+        ))
+        total_time = time.perf_counter() - start_time
+
+        async with session.get(f"{base_url}/stats") as response:
+            after = await response.json()
+
+    batches = after['batches'] - before['batches']
+    frames = after['frames'] - before['frames']
+    stats = {'batches': batches, 'frames': frames, 'avg_batch': frames / batches if batches else 0.0}
+    return latencies, errors, total_time, stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест сервиса распознавания")
+    parser.add_argument("image", help="Путь к тестовому изображению")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=50,
+                        help="Количество запросов на одного клиента")
+    args = parser.parse_args()
+
+    for concurrency in args.concurrency:
+        latencies, errors, total_time, stats = asyncio.run(
+            run_load_test(args.url, args.image, concurrency, args.requests)
+        )
+        if not latencies:
+            print(f"Клиентов: {concurrency} | Все запросы завершились ошибкой: {errors[:3]}")
+            continue
+
+        latencies_ms = np.array(latencies) * 1000
+        print(f"Клиентов: {concurrency:3d} | Запросов: {len(latencies)} | Ошибок: {len(errors)} | "
+              f"p50: {np.percentile(latencies_ms, 50):.1f} мс | "
+              f"p99: {np.percentile(latencies_ms, 99):.1f} мс | "
+              f"Пропускная способность: {len(latencies) / total_time:.1f} запр/с | "
+              f"Средний пакет: {stats['avg_batch']:.2f}")
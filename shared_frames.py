@@ -0,0 +1,265 @@
+import multiprocessing as mp
+import os
+import queue
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+
+class SharedFrameRing:
+    """Кольцо слотов в разделяемой памяти для передачи кадров между процессами
+
+    Кадры лежат в одном блоке multiprocessing.shared_memory, через очереди
+    передаются только короткие описатели (номер слота, номер кадра, время).
+    Свободные слоты возвращаются в очередь free, поэтому захват кадров
+    автоматически притормаживает, когда распознавание не успевает.
+
+    Используется только в bench_shared_frames.py; основной конвейер распознавания
+    кольцо пока не использует.
+    """
+
+    def __init__(self, slots, shape, dtype=np.uint8):
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=self.frame_bytes * slots)
+        self.owner = True
+
+        self.free = mp.Queue()
+        self.filled = mp.Queue()
+        # Остановка захвата, когда обработка кадров невозможна
+        self.stopped = mp.Event()
+        for slot in range(slots):
+            self.free.put(slot)
+        self._views = None
+
+    def __getstate__(self):
+        # В дочерний процесс передаем только имя блока, сама память не копируется
+        state = self.__dict__.copy()
+        state['shm'] = self.shm.name
+        state['owner'] = False
+        state['_views'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        try:
+            self.shm = shared_memory.SharedMemory(name=state['shm'], track=False)
+        except TypeError:
+            # До Python 3.13 подключение к блоку регистрирует его повторно,
+            # и трекер ресурсов ругается на "утечку" при выходе обработчика.
+            # В Windows трекер не используется, снимать регистрацию нечего
+            self.shm = shared_memory.SharedMemory(name=state['shm'])
+            if os.name == "posix":
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+
+    def view(self, slot):
+        """Массив numpy поверх памяти слота (без копирования)"""
+        if self._views is None:
+            self._views = [np.ndarray(self.shape, self.dtype, buffer=self.shm.buf,
+                                      offset=i * self.frame_bytes)
+                           for i in range(self.slots)]
+        return self._views[slot]
+
+    def acquire(self, timeout=None):
+        """Берет свободный слот; None, если за timeout свободных слотов не появилось или поток остановлен"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.stopped.is_set():
+            # Ждем короткими интервалами, чтобы заметить остановку
+            wait = 0.5 if deadline is None else max(min(deadline - time.monotonic(), 0.5), 0)
+            try:
+                return self.free.get(timeout=wait)
+            except queue.Empty:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return None
+        return None
+
+    def publish(self, slot, frame_index, media_ms):
+        self.filled.put((slot, frame_index, media_ms))
+
+    def get(self, timeout=None):
+        """Следующий описатель кадра; None означает конец потока"""
+        return self.filled.get(timeout=timeout)
+
+    def release(self, slot):
+        self.free.put(slot)
+
+    def stop(self):
+        """Прерывает захват: acquire сразу возвращает None"""
+        self.stopped.set()
+
+    def finish(self, consumers):
+        """Сообщает всем обработчикам об окончании потока"""
+        for _ in range(consumers):
+            self.filled.put(None)
+
+    def close(self):
+        self._views = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def probe_frame_shape(source):
+    """Определяет размер кадров источника для создания слотов"""
+    cap = cv2.VideoCapture(source)
+    ret, frame = cap.read()
+    cap.release()
+    if not ret:
+        raise RuntimeError(f"Не удалось прочитать кадр из {source}")
+    return frame.shape
+
+
+def capture_process(source, ring, consumers, every_n=1, drop_when_full=False):
+    """Процесс захвата: читает кадры прямо в слоты разделяемой памяти"""
+    cap = cv2.VideoCapture(source)
+    frame_index = 0
+    dropped = 0
+    try:
+        while not ring.stopped.is_set():
+            if frame_index % every_n:
+                if not cap.grab():
+                    break
+                frame_index += 1
+                continue
+
+            # Для живой камеры лучше пропустить кадр, чем отстать от реального времени
+            slot = ring.acquire(timeout=0 if drop_when_full else None)
+            if slot is None:
+                if ring.stopped.is_set() or not cap.grab():
+                    break
+                dropped += 1
+                frame_index += 1
+                continue
+
+            view = ring.view(slot)
+            ret, frame = cap.read(view)
+            if not ret:
+                ring.release(slot)
+                break
+            if frame is not view:
+                # OpenCV выделил новый буфер (другой размер кадра) - приводим к размеру слота
+                if frame.shape != view.shape:
+                    frame = cv2.resize(frame, (view.shape[1], view.shape[0]))
+                np.copyto(view, frame)
+
+            ring.publish(slot, frame_index, cap.get(cv2.CAP_PROP_POS_MSEC))
+            frame_index += 1
+    finally:
+        cap.release()
+        ring.finish(consumers)
+        if dropped:
+            print(f"Захват: пропущено кадров из-за занятых слотов: {dropped}")
+
+
+def make_workload(workload):
+    """Создает функцию обработки кадра внутри процесса обработчика"""
+    if workload == "recognize":
+        from nomeroff_net import pipeline
+        from video_recognition import recognize_frames
+
+        number_plate_detection_and_reading = pipeline(
+            "number_plate_detection_and_reading",
+            image_loader=None
+        )
+        return lambda frame: recognize_frames([frame], number_plate_detection_and_reading)[0]
+
+    if workload.startswith("blur"):
+        # Синтетическая нагрузка для измерения самого транспорта: blur:<повторов>
+        repeats = int(workload.split(":")[1]) if ":" in workload else 1
+
+        def blur(frame):
+            small = cv2.resize(frame, (frame.shape[1] // 2, frame.shape[0] // 2))
+            for _ in range(repeats):
+                small = cv2.GaussianBlur(small, (9, 9), 0)
+            return []
+        return blur
+
+    raise ValueError(f"Неизвестная нагрузка: {workload}")
+
+
+def inference_process(ring, results, workload):
+    """Процесс обработки: берет описатели, читает кадр из слота и возвращает слот
+
+    Ошибка запуска (загрузка моделей, неизвестная нагрузка) передается в results
+    строкой; признак окончания None отправляется всегда.
+    """
+    cv2.setNumThreads(1)
+    try:
+        handle = make_workload(workload)
+        while True:
+            descriptor = ring.get()
+            if descriptor is None:
+                break
+            slot, frame_index, media_ms = descriptor
+            try:
+                plates = handle(ring.view(slot))
+            except Exception as e:
+                print(f"Ошибка при обработке кадра {frame_index}: {str(e)}")
+                plates = []
+            finally:
+                ring.release(slot)
+            results.put((frame_index, media_ms, plates))
+    except Exception as e:
+        results.put(f"Ошибка процесса обработки: {type(e).__name__}: {str(e)}")
+    finally:
+        results.put(None)
+
+
+def run_shared_memory_pipeline(source, workers=2, slots=None, workload="recognize",
+                               every_n=1, drop_when_full=False):
+    """Запускает процесс захвата и несколько процессов обработки, возвращает результаты по порядку кадров"""
+    shape = probe_frame_shape(source)
+    ring = SharedFrameRing(slots or workers * 2, shape)
+    results = mp.Queue()
+
+    processes = [mp.Process(target=inference_process, args=(ring, results, workload), daemon=True)
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    capture = mp.Process(target=capture_process,
+                         args=(source, ring, workers, every_n, drop_when_full), daemon=True)
+    capture.start()
+
+    collected = []
+    errors = []
+    finished = 0
+    lost = 0
+    while finished + lost < workers:
+        try:
+            item = results.get(timeout=1.0)
+        except queue.Empty:
+            # Аварийно завершившийся процесс не пришлет признак окончания
+            crashed = sum(1 for process in processes if process.exitcode not in (None, 0))
+            if crashed > lost:
+                lost = crashed
+                errors.append(f"Процесс обработки завершился аварийно ({lost} из {workers})")
+                ring.stop()
+            if capture.exitcode not in (None, 0) and not ring.stopped.is_set():
+                errors.append(f"Процесс захвата завершился с кодом {capture.exitcode}")
+                ring.stop()
+                ring.finish(workers)
+            continue
+        if item is None:
+            finished += 1
+        elif isinstance(item, str):
+            errors.append(item)
+            ring.stop()
+        else:
+            collected.append(item)
+
+    for process in [capture] + processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+    ring.close()
+    if errors:
+        raise RuntimeError("; ".join(errors))
+
+    # Обработчики работают параллельно, поэтому восстанавливаем порядок кадров
+    collected.sort(key=lambda item: item[0])
+    return collected
@@ -0,0 +1,171 @@
+import ctypes
+import gc
+import inspect
+import os
+import time
+import types
+
+import torch
+
+WEIGHTS_PATH = "models/shared_weights.pt"
+
+
+def mmap_supported():
+    """torch.load(mmap=True) и load_state_dict(assign=True) появились в torch 2.1"""
+    return ("mmap" in inspect.signature(torch.load).parameters and
+            "assign" in inspect.signature(torch.nn.Module.load_state_dict).parameters)
+
+
+def on_cpu(module):
+    """Все параметры и буферы модели в памяти CPU"""
+    return all(tensor.device.type == "cpu"
+               for tensor in list(module.parameters()) + list(module.buffers()))
+
+
+def find_modules(root, max_depth=8):
+    """Находит модели torch внутри объекта пайплайна
+
+    Возвращает словарь путь атрибута -> модуль верхнего уровня. Порядок обхода
+    детерминирован, поэтому в разных процессах пути совпадают. Модели на GPU
+    пропускаются: assign=True перенес бы их на CPU вместе с весами из файла.
+    """
+    modules = {}
+    seen = set()
+    stack = [("", root, 0)]
+    while stack:
+        path, obj, depth = stack.pop()
+        if id(obj) in seen or depth > max_depth:
+            continue
+        seen.add(id(obj))
+
+        if isinstance(obj, torch.nn.Module):
+            if on_cpu(obj):
+                modules[path] = obj
+            continue
+        if isinstance(obj, (types.ModuleType, types.FunctionType, types.MethodType, type,
+                            torch.Tensor, str, bytes)):
+            continue
+        if isinstance(obj, dict):
+            children = [(str(key), value) for key, value in obj.items()]
+        elif isinstance(obj, (list, tuple)):
+            children = [(str(i), value) for i, value in enumerate(obj)]
+        elif hasattr(obj, "__dict__"):
+            children = list(vars(obj).items())
+        else:
+            continue
+        for key, child in reversed(children):
+            stack.append((f"{path}.{key}" if path else key, child, depth + 1))
+    return modules
+
+
+def weights_signature(modules):
+    """Имена, формы и типы тензоров: по ним видно, что файл весов подходит к моделям"""
+    return {
+        name: [[key, list(tensor.shape), str(tensor.dtype)] for key, tensor in module.state_dict().items()]
+        for name, module in modules.items()
+    }
+
+
+def export_weights(number_plate_detection_and_reading, path=WEIGHTS_PATH):
+    """Сохраняет веса всех моделей пайплайна одним файлом, пригодным для отображения в память"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    modules = find_modules(number_plate_detection_and_reading)
+    checkpoint = {
+        'signature': weights_signature(modules),
+        'modules': {name: module.state_dict() for name, module in modules.items()},
+    }
+    # Обработчики могут создавать файл одновременно, поэтому у каждого свой временный файл
+    part_path = f"{path}.{os.getpid()}.part"
+    torch.save(checkpoint, part_path)
+    os.replace(part_path, path)
+    return len(modules)
+
+
+def release_free_memory():
+    """Возвращает системе память, освобожденную после замены весов"""
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def map_weights(number_plate_detection_and_reading, path=WEIGHTS_PATH):
+    """Подменяет веса моделей тензорами, отображенными из файла только для чтения
+
+    Страницы файла лежат в кэше ОС один раз и делятся всеми процессами, которые
+    его отобразили. Возвращает число моделей и объем весов в байтах или None,
+    если файл не подходит к моделям (например, после обновления моделей).
+    """
+    modules = find_modules(number_plate_detection_and_reading)
+    checkpoint = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    if checkpoint.get('signature') != weights_signature(modules):
+        return None
+
+    mapped_bytes = 0
+    with torch.no_grad():
+        for name, module in modules.items():
+            state = checkpoint['modules'][name]
+            # assign=True: параметры становятся тензорами из файла, а не копируются в свои
+            module.load_state_dict(state, assign=True)
+            mapped_bytes += sum(tensor.numel() * tensor.element_size() for tensor in state.values())
+    release_free_memory()
+    return len(modules), mapped_bytes
+
+
+def share_weights(number_plate_detection_and_reading, path=WEIGHTS_PATH):
+    """Переводит пайплайн на общие веса, при первом запуске (или устаревшем файле) создает файл
+
+    Возвращает None и оставляет обычные веса, если torch старше 2.1 или все модели на GPU.
+    """
+    if not mmap_supported():
+        print(f"Общие веса недоступны в torch {torch.__version__} (нужен 2.1+), веса загружены обычным образом")
+        return None
+    if not find_modules(number_plate_detection_and_reading):
+        print("Модели работают на GPU, общие веса не используются")
+        return None
+
+    mapped = map_weights(number_plate_detection_and_reading, path) if os.path.exists(path) else None
+    if mapped is None:
+        print(f"Сохранение весов для общего доступа в {path}...")
+        export_weights(number_plate_detection_and_reading, path)
+        mapped = map_weights(number_plate_detection_and_reading, path)
+    count, mapped_bytes = mapped
+    print(f"Общие веса: {count} моделей, {mapped_bytes / 1024 ** 2:.0f} МБ из {path}")
+    return mapped
+
+
+def load_pipeline(image_loader="opencv", shared=True, path=WEIGHTS_PATH):
+    """Создает пайплайн распознавания; shared=True - веса общие для всех процессов"""
+    from nomeroff_net import pipeline
+
+    start_time = time.time()
+    number_plate_detection_and_reading = pipeline(
+        "number_plate_detection_and_reading",
+        image_loader=image_loader
+    )
+    if shared:
+        share_weights(number_plate_detection_and_reading, path)
+    print(f"Пайплайн загружен за {time.time() - start_time:.2f} секунд")
+    return number_plate_detection_and_reading
+
+
+def memory_usage():
+    """RSS, PSS (доля общих страниц делится между процессами) и пиковый RSS процесса в байтах"""
+    usage = {'rss': 0, 'pss': 0, 'peak_rss': 0}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    usage[key.lower()] = int(value.split()[0]) * 1024
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    usage['peak_rss'] = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return usage
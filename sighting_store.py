@@ -0,0 +1,132 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+from plate_matching import normalize_plate
+
+
+class SightingStore:
+    """Постоянное хранилище всех распознанных номеров в SQLite
+
+    Записи копятся в памяти и сохраняются пакетами, чтобы не делать
+    отдельную транзакцию на каждое распознавание.
+    """
+
+    def __init__(self, db_path="reports/sightings.db", batch_size=50, flush_interval=1.0):
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.last_flush = time.monotonic()
+        # Идентификатор запуска: время событий из архива не связано со временем работы программы
+        self.session = uuid.uuid4().hex
+
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS sightings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                number TEXT NOT NULL,
+                plate TEXT NOT NULL,
+                confidence REAL,
+                timestamp TEXT,
+                ts REAL,
+                source TEXT,
+                match TEXT,
+                media_ms REAL,
+                session TEXT
+            )
+        """)
+        # Базы, созданные до появления времени кадра в видео и сессий
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(sightings)")]
+        for column, column_type in (('media_ms', 'REAL'), ('session', 'TEXT')):
+            if column not in columns:
+                self.connection.execute(f"ALTER TABLE sightings ADD COLUMN {column} {column_type}")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_sightings_ts ON sightings (ts)")
+        self.connection.commit()
+
+    def add(self, sighting):
+        """Добавляет запись; на диск она попадет при следующем сбросе пакета"""
+        ts = sighting.get('ts', time.time())
+        match = sighting.get('match')
+        self.pending.append((
+            sighting['number'],
+            normalize_plate(sighting['number']),
+            sighting.get('confidence'),
+            sighting.get('timestamp', time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))),
+            ts,
+            sighting.get('source'),
+            json.dumps(match, ensure_ascii=False) if match else None,
+            sighting.get('media_ms'),
+            self.session,
+        ))
+        if (len(self.pending) >= self.batch_size or
+                time.monotonic() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Сохраняет накопленные записи одной транзакцией"""
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO sightings "
+                "(number, plate, confidence, timestamp, ts, source, match, media_ms, session) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self.pending
+            )
+        self.pending = []
+
+    def _where(self, since=None, until=None, session=None):
+        """Условие выборки по времени событий и сессии"""
+        conditions = []
+        params = []
+        if since is not None:
+            conditions.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("ts < ?")
+            params.append(until)
+        if session is not None:
+            conditions.append("session = ?")
+            params.append(session)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return where, params
+
+    def count(self, since=None, until=None, session=None):
+        """Количество записей и уникальных номеров"""
+        self.flush()
+        where, params = self._where(since, until, session)
+        query = "SELECT COUNT(*), COUNT(DISTINCT plate) FROM sightings" + where
+        return self.connection.execute(query, params).fetchone()
+
+    def iter_sightings(self, since=None, until=None, session=None):
+        """Перебирает записи в порядке времени без загрузки всей истории в память"""
+        self.flush()
+        where, params = self._where(since, until, session)
+        query = ("SELECT number, confidence, timestamp, ts, source, match, media_ms "
+                 "FROM sightings" + where + " ORDER BY ts")
+
+        rows = self.connection.execute(query, params)
+        for number, confidence, timestamp, ts, source, match, media_ms in rows:
+            yield {
+                'number': number,
+                'confidence': confidence,
+                'timestamp': timestamp,
+                'ts': ts,
+                'source': source,
+                'match': json.loads(match) if match else None,
+                'media_ms': media_ms,
+            }
+
+    def close(self):
+        self.flush()
+        self.connection.close()
@@ -0,0 +1,119 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from event_uplink import decode_batch
+
+
+class UplinkStubServer:
+    """Заглушка центрального сервера для проверки отправки событий
+
+    Принимает пакеты EventUplink, отбрасывает повторы по event_id и может
+    имитировать плохую связь: случайные ошибки 503 и задержку ответа.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8090, fail_rate=0.0, delay=0.0, output=None):
+        self.fail_rate = fail_rate
+        self.delay = delay
+        self.output = output
+        self.event_ids = set()
+        self.events = []
+        self.batches = 0
+        self.duplicates = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/events"
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if random.random() < stub.fail_rate:
+                    with stub.lock:
+                        stub.failures += 1
+                    self._reply(503, {'error': "simulated outage"})
+                    return
+                try:
+                    events = decode_batch(body, self.headers.get("Content-Encoding"))
+                except Exception as e:
+                    self._reply(400, {'error': str(e)})
+                    return
+                self._reply(200, stub.accept(events))
+
+            def do_GET(self):
+                self._reply(200, stub.stats())
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def accept(self, events):
+        """Сохраняет новые события, повторы по event_id пропускает"""
+        accepted = []
+        with self.lock:
+            self.batches += 1
+            for event in events:
+                if event.get('event_id') in self.event_ids:
+                    self.duplicates += 1
+                    continue
+                self.event_ids.add(event.get('event_id'))
+                self.events.append(event)
+                accepted.append(event)
+            if self.output and accepted:
+                with open(self.output, "a", encoding="utf-8") as f:
+                    for event in accepted:
+                        f.write(json.dumps(event, ensure_ascii=False) + "\n")
+        return {'accepted': len(accepted), 'duplicates': len(events) - len(accepted)}
+
+    def stats(self):
+        with self.lock:
+            return {'events': len(self.events), 'batches': self.batches,
+                    'duplicates': self.duplicates, 'failures': self.failures}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="uplink-stub", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Заглушка центрального сервера событий")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Доля запросов с ответом 503")
+    parser.add_argument("--delay", type=float, default=0.0, help="Задержка ответа в секундах")
+    parser.add_argument("--output", default=None, help="Дописывать принятые события в JSONL")
+    args = parser.parse_args()
+
+    stub = UplinkStubServer(args.host, args.port, args.fail_rate, args.delay, args.output)
+    print(f"Прием событий: {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
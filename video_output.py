@@ -0,0 +1,216 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+
+
+def draw_timestamp(frame, text):
+    """Подписывает время кадра в левом верхнем углу"""
+    cv2.putText(frame, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 4)
+    cv2.putText(frame, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+    return frame
+
+
+def annotate_frame(frame, plates, timestamp_text=None):
+    """Рисует рамки и номера (список словарей number/bbox) на копии кадра"""
+    frame = frame.copy()
+    for plate in plates:
+        bbox = plate.get('bbox')
+        if bbox is None:
+            continue
+        cv2.rectangle(frame, (int(bbox[0]), int(bbox[1])), (int(bbox[2]), int(bbox[3])),
+                      (0, 255, 0), 2)
+        cv2.putText(frame, plate['number'], (int(bbox[0]), int(bbox[1] - 10)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+    if timestamp_text:
+        draw_timestamp(frame, timestamp_text)
+    return frame
+
+
+class AnnotatedVideoWriter:
+    """Фоновая запись кадров в видеофайл через cv2.VideoWriter
+
+    Кодирование идет в отдельном потоке, цикл распознавания только кладет
+    кадр в ограниченную очередь. Кадр после write() изменять нельзя.
+    """
+
+    def __init__(self, path, fps=25.0, fourcc="mp4v", queue_size=64, drop_policy="block"):
+        # drop_policy: "block" - ждем кодировщик (в архиве кадры терять нельзя),
+        # "drop" - пропускаем кадр, если кодировщик не успевает (живая камера)
+        if drop_policy not in ("block", "drop"):
+            raise ValueError(f"Неизвестная политика переполнения: {drop_policy}")
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.fps = fps
+        self.fourcc = fourcc
+        self.drop_policy = drop_policy
+
+        self.written_count = 0
+        self.dropped_count = 0
+        self.cpu_seconds = 0.0
+        self.error = None
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._worker, name="video-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, frame):
+        """Ставит кадр в очередь на кодирование, возвращает False если он отброшен"""
+        if self.drop_policy == "block":
+            self.queue.put(frame)
+            return True
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except queue.Full:
+            self.dropped_count += 1
+            return False
+
+    def _worker(self):
+        """Поток кодирования: размер видео берется по первому кадру"""
+        writer = None
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            if self.error is not None:
+                continue
+
+            cpu_start = time.thread_time()
+            try:
+                if writer is None:
+                    height, width = frame.shape[:2]
+                    writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc),
+                                             self.fps, (width, height))
+                    if not writer.isOpened():
+                        raise IOError(f"Не удалось открыть {self.path} для записи ({self.fourcc})")
+                writer.write(frame)
+                self.written_count += 1
+            except Exception as e:
+                self.error = e
+                print(f"Ошибка при записи видео {self.path}: {str(e)}")
+            self.cpu_seconds += time.thread_time() - cpu_start
+
+        if writer is not None:
+            cpu_start = time.thread_time()
+            writer.release()
+            self.cpu_seconds += time.thread_time() - cpu_start
+
+    def stats(self):
+        """Возвращает статистику записи; размер файла точен после close()"""
+        return {
+            'queued': self.queue.qsize(),
+            'written': self.written_count,
+            'dropped': self.dropped_count,
+            'written_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            'cpu_seconds': self.cpu_seconds,
+        }
+
+    def close(self):
+        """Дожидается кодирования оставшихся кадров и закрывает файл"""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+
+class EventClipWriter:
+    """Запись коротких роликов вокруг событий вместо всего видео
+
+    Последние pre_roll секунд кадров хранятся в кольцевом буфере; при появлении
+    номера ролик начинается с них и продолжается, пока номера не пропадут
+    на post_roll секунд. Буфер держит несжатые кадры: для 1080p при 25 FPS
+    это около 150 МБ на секунду pre_roll. Буфер пополняется и во время записи,
+    поэтому ролик, начатый сразу после предыдущего, тоже получает pre_roll.
+
+    Законченный ролик дописывается и закрывается в отдельном потоке, чтобы
+    add() не ждал кодирования хвоста очереди; его статистика учитывается
+    после закрытия (окончательно - в close()).
+    """
+
+    def __init__(self, output_dir="results", fps=25.0, pre_roll=2.0, post_roll=2.0,
+                 fourcc="mp4v", extension="mp4", drop_policy="block"):
+        self.output_dir = output_dir
+        self.fps = fps
+        self.post_roll = post_roll
+        self.fourcc = fourcc
+        self.extension = extension
+        self.drop_policy = drop_policy
+
+        self.ring = deque(maxlen=max(int(round(pre_roll * fps)), 1))
+        self.writer = None
+        self.last_event = None
+        # Закрывающиеся ролики: (поток закрытия, писатель)
+        self.closing = []
+
+        self.clip_count = 0
+        self.totals = {'written': 0, 'dropped': 0, 'written_bytes': 0, 'cpu_seconds': 0.0}
+
+    def add(self, frame, plates, timestamp):
+        """Учитывает очередной (уже подписанный) кадр; timestamp - время кадра в секундах"""
+        self.ring.append(frame)
+        if self.writer is None:
+            if not plates:
+                return
+            self._open_clip(plates, timestamp)
+            # Текущий кадр уже в буфере и пишется вместе с ним
+            for buffered in self.ring:
+                self.writer.write(buffered)
+            self.last_event = timestamp
+            return
+
+        self.writer.write(frame)
+        if plates:
+            self.last_event = timestamp
+        elif timestamp - self.last_event > self.post_roll:
+            self._close_clip()
+
+    def _open_clip(self, plates, timestamp):
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(timestamp))
+        millis = int((timestamp % 1) * 1000)
+        safe_number = plates[0]['number'].replace(' ', '')
+        path = os.path.join(self.output_dir, f"clip_{stamp}_{millis:03d}_{safe_number}.{self.extension}")
+        self.writer = AnnotatedVideoWriter(path, self.fps, self.fourcc, drop_policy=self.drop_policy)
+        self.clip_count += 1
+
+    def _close_clip(self):
+        thread = threading.Thread(target=self.writer.close, name="clip-closer", daemon=True)
+        thread.start()
+        self.closing.append((thread, self.writer))
+        self.writer = None
+        self._collect_closed()
+
+    def _collect_closed(self, wait=False):
+        """Учитывает статистику роликов, которые уже закрыты (или дожидается всех при wait)"""
+        pending = []
+        for thread, writer in self.closing:
+            if wait:
+                thread.join()
+            elif thread.is_alive():
+                pending.append((thread, writer))
+                continue
+            for key, value in writer.stats().items():
+                if key in self.totals:
+                    self.totals[key] += value
+        self.closing = pending
+
+    def stats(self):
+        """Статистика по всем закрытым роликам"""
+        self._collect_closed()
+        stats = dict(self.totals)
+        stats['clips'] = self.clip_count
+        stats['recording'] = self.writer is not None
+        return stats
+
+    def close(self):
+        if self.writer is not None:
+            self._close_clip()
+        self._collect_closed(wait=True)
+        self.ring.clear()
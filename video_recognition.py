@@ -3,10 +3,19 @@ import numpy as np
 import time
 import os
 import re
+import argparse
+from datetime import datetime
 from nomeroff_net import pipeline
 from nomeroff_net.tools import unzip
+from evidence_writer import EvidenceWriter
+from video_output import AnnotatedVideoWriter, EventClipWriter, draw_timestamp
+from sighting_store import SightingStore
+from auto_tuner import load_or_tune
+from multiscale import set_detection_scale
+from event_uplink import EventUplink
+from cpu_governor import CpuGovernor
 
-def is_valid_russian_plate(text):
+def is_valid_russian_plate(text, verbose=True):
     """Проверяет соответствие номера формату российских номеров"""
     # Разрешенные буквы (кириллица и латиница)
     allowed_letters_cyrillic = 'АВЕКМНОРСТУХ'
@@ -21,11 +30,13 @@ def is_valid_russian_plate(text):
     
     # Удаляем пробелы и приводим к верхнему регистру
     text = text.replace(' ', '').upper()
-    print(f"Проверка номера: {text}")
+    if verbose:
+        print(f"Проверка номера: {text}")
     
     # Проверяем длину (8 или 9 символов)
     if len(text) not in [8, 9]:
-        print(f"Неверная длина: {len(text)}")
+        if verbose:
+            print(f"Неверная длина: {len(text)}")
         return False
     
     # Заменяем латинские буквы на кириллические
@@ -36,21 +47,25 @@ def is_valid_russian_plate(text):
         else:
             text_cyrillic += char
     
-    print(f"Преобразованный номер: {text_cyrillic}")
+    if verbose:
+        print(f"Преобразованный номер: {text_cyrillic}")
     
     # Проверяем формат: буква-цифры-буквы-цифры
     pattern = f'^[{allowed_letters_cyrillic}][0-9]{{3}}[{allowed_letters_cyrillic}]{{2}}[0-9]{{2,3}}$'
     if not re.match(pattern, text_cyrillic):
-        print(f"Не соответствует паттерну: {pattern}")
+        if verbose:
+            print(f"Не соответствует паттерну: {pattern}")
         return False
     
     # Проверяем код региона (не должен быть 00)
     region = text_cyrillic[-2:] if len(text_cyrillic) == 8 else text_cyrillic[-3:]
     if region == '00':
-        print("Недопустимый код региона: 00")
+        if verbose:
+            print("Недопустимый код региона: 00")
         return False
     
-    print("Номер валидный")
+    if verbose:
+        print("Номер валидный")
     return True
 
 def format_plate_number(text):
@@ -79,21 +94,58 @@ def format_plate_number(text):
     else:  # 9 символов
         return f"{text_cyrillic[0]} {text_cyrillic[1:4]} {text_cyrillic[4:6]} {text_cyrillic[6:]}"
 
+def parse_start_time(value):
+    """Разбирает время начала записи: 'ГГГГ-ММ-ДД ЧЧ:ММ:СС' или секунды Unix"""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y%m%d_%H%M%S"):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"Не удалось разобрать время начала записи: {value}")
+
+def format_timestamp(ts):
+    """Форматирует абсолютное время события с миллисекундами"""
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+def guess_recording_start(video_path, duration):
+    """Оценивает начало записи: время изменения файла минус длительность видео"""
+    return os.path.getmtime(video_path) - duration
+
+def frame_media_ms(cap, frame_index, fps):
+    """Время кадра в видео (PTS) в миллисекундах, только что прочитанного из cap
+
+    Если контейнер не сообщает время, оно вычисляется по номеру кадра и FPS.
+    """
+    media_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+    if media_ms <= 0 and frame_index > 0:
+        media_ms = frame_index * 1000.0 / (fps or 25.0)
+    return media_ms
+
 def extract_frames(video_path, output_dir):
-    """Извлекает кадры из видео и сохраняет их в директорию"""
+    """Извлекает кадры из видео и сохраняет их в директорию
+
+    Возвращает количество кадров и время каждого кадра в видео (мс).
+    """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         print(f"Ошибка: Не удалось открыть видео файл {video_path}")
-        return 0
+        return 0, []
     
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
     frame_count = 0
+    media_times = []
     while True:
         ret, frame = cap.read()
         if not ret:
             break
+        media_times.append(frame_media_ms(cap, frame_count, fps))
         
         frame_path = os.path.join(output_dir, f"frame_{frame_count:06d}.jpg")
         cv2.imwrite(frame_path, frame)
@@ -103,28 +155,73 @@ def extract_frames(video_path, output_dir):
             print(f"Извлечено кадров: {frame_count}")
     
     cap.release()
-    return frame_count
+    return frame_count, media_times
 
-def process_frame(frame_path, number_plate_detection_and_reading):
-    """Обрабатывает один кадр и возвращает результаты"""
+def process_frames(frame_paths, number_plate_detection_and_reading):
+    """Обрабатывает пакет кадров одним вызовом пайплайна и возвращает результаты по каждому"""
     try:
-        result = number_plate_detection_and_reading([frame_path])
+        result = number_plate_detection_and_reading(frame_paths)
         (images, images_bboxs, 
          images_points, images_zones, region_ids, 
          region_names, count_lines, 
          confidences, texts) = unzip(result)
         
-        return {
-            'texts': texts[0],
-            'confidences': confidences[0],
-            'bboxs': images_bboxs[0],
+        return [{
+            'texts': texts[i],
+            'confidences': confidences[i],
+            'bboxs': images_bboxs[i],
             'success': True
-        }
+        } for i in range(len(frame_paths))]
     except Exception as e:
-        print(f"Ошибка при обработке кадра {frame_path}: {str(e)}")
-        return {'success': False, 'error': str(e)}
+        print(f"Ошибка при обработке кадров {frame_paths[0]}...: {str(e)}")
+        return [{'success': False, 'error': str(e)} for _ in frame_paths]
 
-def process_video(video_path):
+def process_frame(frame_path, number_plate_detection_and_reading):
+    """Обрабатывает один кадр и возвращает результаты"""
+    return process_frames([frame_path], number_plate_detection_and_reading)[0]
+
+def recognize_frames(frames, number_plate_detection_and_reading,
+                     confidence_threshold=0.0, verbose=False):
+    """Распознает номера на пакете кадров BGR и возвращает валидные номера по каждому кадру
+
+    Пайплайн должен быть создан с image_loader=None, чтобы принимать массивы numpy.
+    """
+    rgb_frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
+    result = number_plate_detection_and_reading(rgb_frames)
+    (images, images_bboxs, 
+     images_points, images_zones, region_ids, 
+     region_names, count_lines, 
+     confidences, texts) = unzip(result)
+    
+    frames_plates = []
+    for frame_bboxs, frame_confidences, frame_texts in zip(images_bboxs, confidences, texts):
+        plates = []
+        for i, (text_list, conf_list) in enumerate(zip(frame_texts, frame_confidences)):
+            if not text_list:
+                continue
+            text = ''.join(text_list)
+            conf = float(np.mean(conf_list)) if conf_list else 0.0
+            if conf < confidence_threshold or not is_valid_russian_plate(text, verbose):
+                continue
+            bbox = [float(v) for v in frame_bboxs[i][:4]] if len(frame_bboxs) > i else None
+            plates.append({
+                'number': format_plate_number(text),
+                'raw': text,
+                'confidence': conf,
+                'bbox': bbox
+            })
+        frames_plates.append(plates)
+    return frames_plates
+
+def process_video(video_path, jpeg_quality=90, max_disk_bytes=2 * 1024 ** 3,
+                  recording_start=None, db_path="reports/sightings.db", detection_scale=1.0,
+                  output_mode="jpeg", pre_roll=2.0, post_roll=2.0, uplink_url=None,
+                  cpu_budget=None, latency_budget_ms=None):
+    # output_mode: "jpeg" - снимок лучшего кадра каждого события,
+    # "video" - одно подписанное видео целиком, "clips" - ролики вокруг событий
+    if output_mode not in ("jpeg", "video", "clips"):
+        raise ValueError(f"Неизвестный режим вывода: {output_mode}")
+    
     # Проверяем существование файла
     if not os.path.exists(video_path):
         print(f"Ошибка: Файл {video_path} не найден!")
@@ -145,25 +242,98 @@ def process_video(video_path):
         image_loader="opencv"
     )
     
+    # Детектор работает на уменьшенной копии, OCR - на вырезках из полного кадра;
+    # масштаб применяется до подбора, чтобы замеры шли на рабочей нагрузке
+    set_detection_scale(number_plate_detection_and_reading, detection_scale)
+    
+    # Потоки и размер пакета подбираются один раз для компьютера, модели прогреваются
+    tuning = load_or_tune(number_plate_detection_and_reading, uses_paths=True)
+    batch_size = tuning['batch_size']
+    
+    # Регулятор нагрузки: в архиве кадры не пропускаются, лишняя нагрузка снимается
+    # уменьшением потоков, пакета и паузами между пакетами
+    governor = None
+    if cpu_budget or latency_budget_ms:
+        governor = CpuGovernor(cpu_budget=cpu_budget, latency_budget_ms=latency_budget_ms,
+                               max_threads=tuning['torch_threads'], max_cv2_threads=tuning['cv2_threads'],
+                               max_batch=batch_size, allow_skip=False)
+    
     # Извлекаем кадры из видео
     print("Извлечение кадров из видео...")
-    total_frames = extract_frames(video_path, frames_dir)
+    total_frames, media_times = extract_frames(video_path, frames_dir)
     print(f"Всего извлечено кадров: {total_frames}")
     
+    # Время событий считается от начала записи по времени кадров в видео,
+    # а не по часам в момент обработки, поэтому не зависит от скорости обработки
+    if recording_start is None:
+        duration = media_times[-1] / 1000 if media_times else 0.0
+        recording_start = guess_recording_start(video_path, duration)
+    print(f"Начало записи: {format_timestamp(recording_start)}")
+    
+    # Снимки пишутся в фоне: по одному лучшему кадру на событие и вырезанный номер
+    evidence_writer = None
+    video_writer = None
+    clip_writer = None
+    if output_mode == "jpeg":
+        evidence_writer = EvidenceWriter(results_dir, jpeg_quality=jpeg_quality,
+                                         max_disk_bytes=max_disk_bytes)
+    else:
+        # Видео кодируется в фоне с FPS исходника, чтобы время в ролике совпадало с записью
+        cap = cv2.VideoCapture(video_path)
+        video_fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        cap.release()
+        if output_mode == "video":
+            stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(recording_start))
+            video_name = os.path.splitext(os.path.basename(video_path))[0]
+            video_writer = AnnotatedVideoWriter(
+                os.path.join(results_dir, f"annotated_{video_name}_{stamp}.mp4"), video_fps)
+        else:
+            clip_writer = EventClipWriter(results_dir, video_fps, pre_roll, post_roll)
+    sighting_store = SightingStore(db_path)
+    event_uplink = EventUplink(uplink_url) if uplink_url else None
+    
     # Обрабатываем каждый кадр
     processed_count = 0
     start_time = time.time()
     
     print("\nНачинаем обработку кадров...")
+    batch_results = {}
+    batch_end = 0
     for frame_num in range(total_frames):
+        # Кадры отправляются в пайплайн пакетами подобранного (или заданного регулятором) размера
+        if frame_num >= batch_end:
+            if governor is not None:
+                active_tracks = len(evidence_writer.open_events) if evidence_writer is not None else 0
+                decision = governor.update(active_tracks)
+                if decision:
+                    print(f"Регулятор нагрузки: {decision} ({governor.describe()})")
+                governor.pause()
+                batch_size = governor.batch_size
+            batch_end = frame_num + batch_size
+            batch_paths = {}
+            for num in range(frame_num, min(batch_end, total_frames)):
+                path = os.path.join(frames_dir, f"frame_{num:06d}.jpg")
+                if os.path.exists(path):
+                    batch_paths[num] = path
+            if batch_paths:
+                recognition_start = time.perf_counter()
+                batch_results = dict(zip(batch_paths, process_frames(
+                    list(batch_paths.values()), number_plate_detection_and_reading)))
+                if governor is not None:
+                    governor.record(time.perf_counter() - recognition_start)
+        
         frame_path = os.path.join(frames_dir, f"frame_{frame_num:06d}.jpg")
-        if not os.path.exists(frame_path):
+        if frame_num not in batch_results:
             continue
             
         print(f"\nОбработка кадра {frame_num + 1}/{total_frames}")
         
-        # Обрабатываем кадр
-        result = process_frame(frame_path, number_plate_detection_and_reading)
+        # Результат кадра из обработанного пакета
+        result = batch_results.pop(frame_num)
+        media_ms = media_times[frame_num]
+        frame_time = recording_start + media_ms / 1000
+        frame = None
+        found_plates = []
         
         if result['success']:
             # Загружаем кадр для визуализации
@@ -187,42 +357,99 @@ def process_video(video_path):
                     if is_valid_russian_plate(text):
                         valid_plates += 1
                         formatted_text = format_plate_number(text)
-                        print(f"Номер {i+1}: {formatted_text} (уверенность: {conf:.2f}) [Валидный]")
+                        print(f"Номер {i+1}: {formatted_text} (уверенность: {conf:.2f}) [Валидный] "
+                              f"время: {format_timestamp(frame_time)}")
+                        sighting = {
+                            'number': formatted_text,
+                            'confidence': float(conf),
+                            'timestamp': format_timestamp(frame_time),
+                            'ts': frame_time,
+                            'media_ms': media_ms,
+                            'source': video_path
+                        }
+                        sighting_store.add(sighting)
+                        if event_uplink is not None:
+                            event_uplink.publish(sighting)
                         
-                        # Рисуем рамку вокруг номера
                         if len(result['bboxs']) > i:
-                            bbox = result['bboxs'][i]
-                            cv2.rectangle(frame, 
-                                        (int(bbox[0]), int(bbox[1])), 
-                                        (int(bbox[2]), int(bbox[3])), 
-                                        (0, 255, 0), 2)
-                            cv2.putText(frame, formatted_text, 
-                                      (int(bbox[0]), int(bbox[1]-10)), 
-                                      cv2.FONT_HERSHEY_SIMPLEX, 
-                                      0.9, (0, 255, 0), 2)
+                            found_plates.append((formatted_text, conf, result['bboxs'][i]))
                     else:
                         print(f"Номер {i+1}: {text} (уверенность: {conf:.2f}) [Не соответствует формату]")
             
             if valid_plates > 0:
-                # Сохраняем обработанный кадр только если найдены валидные номера
-                output_path = os.path.join(results_dir, f"processed_{frame_num:06d}.jpg")
-                cv2.imwrite(output_path, frame)
-                print(f"Сохранен обработанный кадр: {output_path}")
+                # Кадр попадет на диск, только если он лучший для своего события;
+                # снимок берется до отрисовки рамок, чтобы в нем не было наложений
+                if evidence_writer is not None:
+                    for formatted_text, conf, bbox in found_plates:
+                        evidence_writer.offer(formatted_text, conf, frame, bbox, frame_time)
                 processed_count += 1
+            
+            # Рисуем рамки вокруг номеров
+            for formatted_text, conf, bbox in found_plates:
+                cv2.rectangle(frame, 
+                            (int(bbox[0]), int(bbox[1])), 
+                            (int(bbox[2]), int(bbox[3])), 
+                            (0, 255, 0), 2)
+                cv2.putText(frame, formatted_text, 
+                          (int(bbox[0]), int(bbox[1]-10)), 
+                          cv2.FONT_HERSHEY_SIMPLEX, 
+                          0.9, (0, 255, 0), 2)
+        
+        if evidence_writer is not None:
+            # Закрываем события, номера которых давно не появлялись
+            evidence_writer.expire(frame_time)
+        else:
+            # В видео попадают и кадры без номеров
+            if frame is None:
+                frame = cv2.imread(frame_path)
+            if frame is not None:
+                draw_timestamp(frame, format_timestamp(frame_time))
+                if video_writer is not None:
+                    video_writer.write(frame)
+                else:
+                    clip_writer.add(frame, [{'number': text} for text, _, _ in found_plates],
+                                    frame_time)
         
         # Выводим информацию о прогрессе
         elapsed_time = time.time() - start_time
         current_fps = (frame_num + 1) / elapsed_time
         progress = ((frame_num + 1) / total_frames) * 100
-        print(f"Прогресс: {progress:.1f}% | Обработано кадров: {frame_num + 1}/{total_frames} | FPS: {current_fps:.2f}")
+        print(f"Прогресс: {progress:.1f}% | Обработано кадров: {frame_num + 1}/{total_frames} | FPS: {current_fps:.2f}"
+              + (f" | {governor.describe()}" if governor is not None else ""))
+    
+    print("Ожидание записи снимков...")
+    output_writer = evidence_writer or video_writer or clip_writer
+    output_writer.close()
+    writer_stats = output_writer.stats()
+    sighting_store.close()
+    uplink_stats = None
+    if event_uplink is not None:
+        event_uplink.close()
+        uplink_stats = event_uplink.stats()
     
     total_time = time.time() - start_time
-    print(f"\nОбработка завершена:")
+    print("\nОбработка завершена:")
     print(f"Всего кадров: {total_frames}")
     print(f"Успешно обработано кадров: {processed_count}")
     print(f"Общее время: {total_time:.2f} секунд")
     print(f"Средний FPS: {total_frames/total_time:.2f}")
-    print(f"\nОбработанные кадры сохранены в директории: {results_dir}")
+    if output_mode == "jpeg":
+        print(f"Сохранено снимков: {writer_stats['written']} | Отброшено: {writer_stats['dropped']} | "
+              f"Удалено по квоте: {writer_stats['evicted']}")
+    elif output_mode == "video":
+        print(f"Записано кадров видео: {writer_stats['written']} | Отброшено: {writer_stats['dropped']}")
+    else:
+        print(f"Записано роликов: {writer_stats['clips']} | кадров: {writer_stats['written']}")
+    # Для сравнения режимов: сколько места и процессорного времени ушло на запись результата
+    print(f"Объем результата: {writer_stats['written_bytes'] / 1024 ** 2:.1f} МБ | "
+          f"CPU на кодирование: {writer_stats['cpu_seconds']:.2f} секунд")
+    if governor is not None:
+        print(f"Регулятор нагрузки: {governor.describe()} | последнее решение: {governor.decision}")
+    if uplink_stats is not None:
+        print(f"Отправлено событий: {uplink_stats['sent_events']} | "
+              f"ожидают отправки пакетов: {uplink_stats['spooled_batches']} | "
+              f"сжатие: {uplink_stats['compression_ratio']:.1f}x")
+    print(f"\nРезультаты сохранены в директории: {results_dir}")
     
     # Спрашиваем пользователя, хочет ли он удалить временные файлы
     response = input("\nХотите удалить временные файлы кадров? (y/n): ")
@@ -232,6 +459,28 @@ def process_video(video_path):
         print("Временные файлы удалены")
 
 if __name__ == "__main__":
-    # Пример использования
-    video_path = "test.mp4"  # Укажите путь к вашему видео
-    process_video(video_path) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Распознавание номеров в видеофайле")
+    parser.add_argument("video", nargs="?", default="test.mp4", help="Путь к видео")
+    parser.add_argument("--start", default=None,
+                        help="Время начала записи ('ГГГГ-ММ-ДД ЧЧ:ММ:СС' или секунды Unix), "
+                             "по умолчанию оценивается по времени изменения файла")
+    parser.add_argument("--detection-scale", type=float, default=1.0,
+                        help="Масштаб кадра для детектора номеров (1.0 - полное разрешение)")
+    parser.add_argument("--output", choices=["jpeg", "video", "clips"], default="jpeg",
+                        help="jpeg - снимки событий, video - подписанное видео целиком, "
+                             "clips - ролики вокруг событий")
+    parser.add_argument("--pre-roll", type=float, default=2.0, help="Секунд до события в ролике")
+    parser.add_argument("--post-roll", type=float, default=2.0, help="Секунд после события в ролике")
+    parser.add_argument("--cpu-budget", type=float, default=None,
+                        help="Доля всех ядер (%%), которую может занимать распознавание")
+    parser.add_argument("--latency-budget-ms", type=float, default=None,
+                        help="Допустимая задержка распознавания пакета (p95), мс")
+    parser.add_argument("--uplink", default=None,
+                        help="Адрес центрального сервера событий (http://.../events)")
+    args = parser.parse_args()
+    
+    recording_start = parse_start_time(args.start) if args.start else None
+    process_video(args.video, recording_start=recording_start, detection_scale=args.detection_scale,
+                  output_mode=args.output, pre_roll=args.pre_roll, post_roll=args.post_roll,
+                  uplink_url=args.uplink, cpu_budget=args.cpu_budget,
+                  latency_budget_ms=args.latency_budget_ms) 
\ No newline at end of file
@@ -4,14 +4,25 @@ import numpy as np
 import time
 import os
 import re
+import threading
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                            QHBoxLayout, QPushButton, QLabel, QFileDialog, 
-                           QProgressBar, QTextEdit, QMessageBox, QListWidget, 
-                           QInputDialog, QDialog, QSlider, QSpinBox)
-from PyQt5.QtCore import Qt, QTimer
+                           QProgressBar, QMessageBox, 
+                           QInputDialog, QDialog, QSlider, QSpinBox, QDateTimeEdit)
+from PyQt5.QtCore import Qt, QTimer, QDateTime
 from PyQt5.QtGui import QImage, QPixmap
 from nomeroff_net import pipeline
 from nomeroff_net.tools import unzip
+from evidence_writer import EvidenceWriter
+from plate_matching import PlateMatcher
+from sighting_store import SightingStore
+from live_views import LiveSightingList, BatchedLogView
+from camera_discovery import CameraDiscovery, CameraWatcher, ReconnectingCapture, describe_camera
+from video_recognition import frame_media_ms, format_timestamp, guess_recording_start
+from auto_tuner import load_or_tune
+from multiscale import set_detection_scale
+from event_uplink import EventUplink
+from cpu_governor import CpuGovernor
 
 class VideoRecognitionApp(QMainWindow):
     def __init__(self):
@@ -21,19 +32,40 @@ class VideoRecognitionApp(QMainWindow):
         
         # Инициализация переменных
         self.video_path = None
+        self.source_name = None  # Источник кадров для записи в историю
+        self.camera_index = None  # Индекс выбранной камеры, None для видеофайла
+        self.camera_lost = False
         self.cap = None
         self.current_frame = None
         self.frame_count = 0
         self.total_frames = 0
         self.processing = False
         self.number_plate_detection_and_reading = None
-        self.unique_numbers = set()  # Множество для хранения уникальных номеров
-        self.recognized_numbers_data = []  # Список для хранения данных о распознанных номерах
+        # Полная история распознаваний хранится в базе, а не в памяти виджетов
+        self.sighting_store = SightingStore("reports/sightings.db")
+        # Начало записи видеофайла: время событий = начало + время кадра в видео
+        self.recording_start = None
+        self.video_fps = 25.0
         
         # Параметры распознавания (начальные значения - самые лояльные)
         self.confidence_threshold = 0.05  # Минимальный порог уверенности (0.0 - 1.0)
         self.min_plate_width = 30  # Минимальная ширина номера в пикселях
         self.min_plate_height = 10  # Минимальная высота номера в пикселях
+        self.jpeg_quality = 90  # Качество JPEG для снимков событий
+        self.detection_scale = 1.0  # Масштаб кадра для детектора (OCR работает на полном кадре)
+        self.cpu_budget = None  # Доля всех ядер (%) для распознавания; None - без ограничения
+        
+        # Фоновая запись снимков: лучший кадр на событие и вырезанный номер
+        self.evidence_writer = EvidenceWriter("results", jpeg_quality=self.jpeg_quality,
+                                              drop_policy="drop")
+        
+        # Белый и черный списки номеров, перечитываются при изменении файлов
+        self.plate_matcher = PlateMatcher("lists/allow.csv", "lists/deny.csv")
+        
+        # Отправка событий на центральный сервер (адрес задается переменной окружения),
+        # без связи события копятся на диске и уходят после ее восстановления
+        uplink_url = os.environ.get("PLATE_UPLINK_URL")
+        self.event_uplink = EventUplink(uplink_url) if uplink_url else None
         
         # Создание центрального виджета
         central_widget = QWidget()
@@ -92,9 +124,13 @@ class VideoRecognitionApp(QMainWindow):
         self.progress_bar = QProgressBar()
         left_layout.addWidget(self.progress_bar)
         
-        # Создание области вывода логов
-        self.log_text = QTextEdit()
-        self.log_text.setReadOnly(True)
+        # Текущие решения регулятора нагрузки
+        self.governor_label = QLabel()
+        left_layout.addWidget(self.governor_label)
+        
+        # Создание области вывода логов (последние строки, полный лог пишется в файл)
+        self.log_text = BatchedLogView(max_lines=1000, interval_ms=200,
+                                       log_path="reports/gui.log")
         self.log_text.setMaximumHeight(150)
         left_layout.addWidget(self.log_text)
         
@@ -110,8 +146,8 @@ class VideoRecognitionApp(QMainWindow):
         numbers_label.setStyleSheet("font-weight: bold; font-size: 14px;")
         right_layout.addWidget(numbers_label)
         
-        # Список уникальных номеров
-        self.numbers_list = QListWidget()
+        # Список уникальных номеров (последние 1000, старые вытесняются)
+        self.numbers_list = LiveSightingList(capacity=1000)
         self.numbers_list.setMinimumWidth(300)
         right_layout.addWidget(self.numbers_list)
         
@@ -122,68 +158,120 @@ class VideoRecognitionApp(QMainWindow):
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_frame)
         
-        # Инициализация пайплайна
+        # Периодически сохраняем накопленные записи, даже если новых распознаваний нет
+        self.store_timer = QTimer()
+        self.store_timer.timeout.connect(self.sighting_store.flush)
+        self.store_timer.start(1000)
+        
+        # Поиск камер с кэшем и отслеживание подключения/отключения в фоне
+        self.camera_discovery = CameraDiscovery()
+        self.camera_watcher = CameraWatcher(self.camera_discovery)
+        self.camera_watcher.start()
+        self.camera_watch_timer = QTimer()
+        self.camera_watch_timer.timeout.connect(self.check_camera_changes)
+        self.camera_watch_timer.start(1000)
+        
+        # Загрузка, подбор параметров и прогрев моделей идут в фоне, окно отвечает сразу;
+        # регулятор создается после подбора, когда известно число потоков
+        self.tuning = None
+        self.model_error = None
+        self.governor = None
         self.log("Инициализация системы распознавания...")
-        self.number_plate_detection_and_reading = pipeline(
-            "number_plate_detection_and_reading",
-            image_loader="opencv"
-        )
+        self.model_thread = threading.Thread(target=self.load_models, name="model-loader", daemon=True)
+        self.model_thread.start()
+        self.model_timer = QTimer()
+        self.model_timer.timeout.connect(self.check_models)
+        self.model_timer.start(200)
+        
+        self.governor_timer = QTimer()
+        self.governor_timer.timeout.connect(self.update_governor_label)
+        self.governor_timer.start(1000)
+
+    def load_models(self):
+        """Фоновый поток: создает пайплайн, подбирает потоки и прогревает модели"""
+        try:
+            number_plate_detection_and_reading = pipeline(
+                "number_plate_detection_and_reading",
+                image_loader="opencv"
+            )
+            # Масштаб применяется до подбора, чтобы замеры шли на рабочей нагрузке;
+            # прогрев избавляет первый реальный кадр от ленивой инициализации
+            set_detection_scale(number_plate_detection_and_reading, self.detection_scale)
+            self.tuning = load_or_tune(number_plate_detection_and_reading, uses_paths=True)
+            self.number_plate_detection_and_reading = number_plate_detection_and_reading
+        except Exception as e:
+            self.model_error = str(e)
+
+    def check_models(self):
+        """Сообщает об окончании фоновой загрузки моделей"""
+        if self.model_thread.is_alive():
+            return
+        self.model_timer.stop()
+        if self.model_error is not None:
+            self.log(f"Ошибка при загрузке моделей: {self.model_error}")
+            QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить модели:\n{self.model_error}")
+            return
+        # Масштаб могли изменить в настройках, пока шла загрузка
+        set_detection_scale(self.number_plate_detection_and_reading, self.detection_scale)
+        self.log(f"Потоков torch: {self.tuning['torch_threads']}, OpenCV: {self.tuning['cv2_threads']}")
         self.log("Система распознавания инициализирована")
+        
+        # Если распознавание делит компьютер со шлагбаумом и видеорегистратором, регулятор
+        # держит его в пределах заданного бюджета CPU, подбирая шаг, потоки и частоту превью.
+        # Без бюджета обрабатывается каждый кадр
+        self.governor = CpuGovernor(cpu_budget=self.cpu_budget,
+                                    max_threads=self.tuning['torch_threads'],
+                                    max_cv2_threads=self.tuning['cv2_threads'])
 
     def log(self, message):
-        """Добавление сообщения в лог"""
-        self.log_text.append(message)
-        self.log_text.verticalScrollBar().setValue(
-            self.log_text.verticalScrollBar().maximum()
-        )
+        """Добавление сообщения в лог (выводится пачкой на следующем такте)"""
+        self.log_text.append_message(message)
 
     def select_camera(self):
         """Выбор камеры для захвата видеопотока"""
-        # Получаем список доступных камер
-        available_cameras = []
-        for i in range(10):  # Проверяем первые 10 индексов
-            cap = cv2.VideoCapture(i)
-            if cap.isOpened():
-                ret, _ = cap.read()
-                if ret:
-                    available_cameras.append(i)
-                cap.release()
-        
-        if not available_cameras:
+        # Список камер берется из кэша, который обновляется в фоне
+        cameras = self.camera_discovery.discover(busy=self.camera_watcher.busy_indices())
+        
+        if not cameras:
             QMessageBox.warning(self, "Предупреждение", "Камеры не найдены")
             return
             
         # Если найдена только одна камера, используем её
-        if len(available_cameras) == 1:
-            camera_index = available_cameras[0]
+        if len(cameras) == 1:
+            camera_index = cameras[0]['index']
         else:
             # Если найдено несколько камер, показываем диалог выбора
-            camera_index, ok = QInputDialog.getInt(
+            items = [describe_camera(camera) for camera in cameras]
+            item, ok = QInputDialog.getItem(
                 self, 
                 "Выбор камеры", 
-                "Введите номер камеры (0-9):", 
-                value=0, 
-                min=0, 
-                max=9, 
-                step=1
+                "Выберите камеру:", 
+                items, 
+                0, 
+                False
             )
-            if not ok or camera_index not in available_cameras:
+            if not ok:
                 return
+            camera_index = cameras[items.index(item)]['index']
         
-        # Открываем выбранную камеру
-        self.cap = cv2.VideoCapture(camera_index)
+        # Открываем выбранную камеру; при обрыве поток переподключится сам
+        if self.cap:
+            self.cap.release()
+        self.camera_watcher.release_busy(self.camera_index)
+        self.cap = ReconnectingCapture(camera_index, width=1920, height=1080)
         if not self.cap.isOpened():
             QMessageBox.critical(self, "Ошибка", "Не удалось открыть камеру")
             return
-            
-        # Получаем параметры камеры
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)  # Устанавливаем разрешение
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
+        self.camera_index = camera_index
+        self.camera_lost = False
+        self.camera_watcher.mark_busy(camera_index)
         
         # Активируем кнопки
         self.start_btn.setEnabled(True)
         self.stop_btn.setEnabled(True)
         
+        self.source_name = f"camera:{camera_index}"
+        self.recording_start = None
         self.log(f"Выбрана камера {camera_index}")
         
         # Показываем первый кадр
@@ -250,6 +338,52 @@ class VideoRecognitionApp(QMainWindow):
         size_layout.addLayout(height_layout)
         layout.addLayout(size_layout)
         
+        # Качество JPEG для снимков событий
+        quality_layout = QHBoxLayout()
+        quality_label = QLabel("Качество JPEG снимков:")
+        quality_spin = QSpinBox()
+        quality_spin.setRange(30, 100)
+        quality_spin.setValue(self.jpeg_quality)
+        quality_layout.addWidget(quality_label)
+        quality_layout.addWidget(quality_spin)
+        layout.addLayout(quality_layout)
+        
+        # Масштаб кадра для поиска номеров
+        scale_layout = QHBoxLayout()
+        scale_label = QLabel("Масштаб детекции (%):")
+        scale_spin = QSpinBox()
+        scale_spin.setRange(25, 100)
+        scale_spin.setValue(int(self.detection_scale * 100))
+        scale_layout.addWidget(scale_label)
+        scale_layout.addWidget(scale_spin)
+        layout.addLayout(scale_layout)
+        
+        # Начало записи видеофайла, от него отсчитывается время событий
+        start_layout = QHBoxLayout()
+        start_label = QLabel("Начало записи видео:")
+        start_edit = QDateTimeEdit()
+        start_edit.setDisplayFormat("yyyy-MM-dd HH:mm:ss")
+        start_edit.setCalendarPopup(True)
+        if self.recording_start is not None:
+            start_edit.setDateTime(QDateTime.fromMSecsSinceEpoch(int(self.recording_start * 1000)))
+        else:
+            start_edit.setDateTime(QDateTime.currentDateTime())
+            start_edit.setEnabled(False)
+        start_layout.addWidget(start_label)
+        start_layout.addWidget(start_edit)
+        layout.addLayout(start_layout)
+        
+        # Бюджет CPU для регулятора нагрузки
+        budget_layout = QHBoxLayout()
+        budget_label = QLabel("Бюджет CPU (%):")
+        budget_spin = QSpinBox()
+        budget_spin.setRange(0, 100)
+        budget_spin.setSpecialValueText("без ограничения")
+        budget_spin.setValue(self.cpu_budget or 0)
+        budget_layout.addWidget(budget_label)
+        budget_layout.addWidget(budget_spin)
+        layout.addLayout(budget_layout)
+        
         # Кнопки
         buttons = QHBoxLayout()
         ok_button = QPushButton("OK")
@@ -259,6 +393,17 @@ class VideoRecognitionApp(QMainWindow):
             self.confidence_threshold = confidence_slider.value() / 100
             self.min_plate_width = width_spin.value()
             self.min_plate_height = height_spin.value()
+            self.jpeg_quality = quality_spin.value()
+            self.cpu_budget = budget_spin.value() or None
+            if self.governor is not None:
+                self.governor.cpu_budget = self.cpu_budget
+            self.evidence_writer.jpeg_quality = self.jpeg_quality
+            self.detection_scale = scale_spin.value() / 100
+            if self.number_plate_detection_and_reading is not None:
+                set_detection_scale(self.number_plate_detection_and_reading, self.detection_scale)
+            if self.recording_start is not None:
+                self.recording_start = start_edit.dateTime().toMSecsSinceEpoch() / 1000
+                self.log(f"Начало записи: {format_timestamp(self.recording_start)}")
             dialog.accept()
             
         ok_button.clicked.connect(on_ok)
@@ -272,7 +417,9 @@ class VideoRecognitionApp(QMainWindow):
 
     def generate_report(self):
         """Генерация отчета"""
-        if not self.recognized_numbers_data:
+        session = self.sighting_store.session
+        total_sightings, unique_count = self.sighting_store.count(session=session)
+        if not total_sightings:
             QMessageBox.warning(self, "Предупреждение", "Нет данных для отчета")
             return
             
@@ -290,24 +437,25 @@ class VideoRecognitionApp(QMainWindow):
             f.write("Отчет по распознаванию номеров\n")
             f.write("=" * 50 + "\n\n")
             f.write(f"Дата и время создания: {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Всего уникальных номеров: {len(self.unique_numbers)}\n\n")
+            f.write(f"Всего уникальных номеров: {unique_count}\n\n")
             
             f.write("Список распознанных номеров:\n")
             f.write("-" * 50 + "\n")
             
-            # Сортируем данные по времени
-            sorted_data = sorted(self.recognized_numbers_data, key=lambda x: x['timestamp'])
-            
-            for data in sorted_data:
+            # Записи читаются из базы в порядке времени
+            for data in self.sighting_store.iter_sightings(session=session):
                 f.write(f"Номер: {data['number']}\n")
                 f.write(f"Время: {data['timestamp']}\n")
                 f.write(f"Уверенность: {data['confidence']:.2f}\n")
+                if data.get('match'):
+                    f.write(f"Списки: {format_match(data['match'])}\n")
                 f.write("-" * 50 + "\n")
         
-        # Сохраняем скриншот текущего кадра
+        # Сохраняем скриншот текущего кадра в фоне; квота results на отчеты не действует
         if self.current_frame is not None:
             screenshot_path = os.path.join(report_dir, f"screenshot_{timestamp}.jpg")
-            cv2.imwrite(screenshot_path, self.current_frame)
+            if not self.evidence_writer.submit(screenshot_path, self.current_frame.copy(), quota=False):
+                cv2.imwrite(screenshot_path, self.current_frame)
         
         self.log(f"Отчет сохранен в файл: {report_path}")
         QMessageBox.information(self, "Успех", f"Отчет успешно создан:\n{report_path}")
@@ -323,6 +471,11 @@ class VideoRecognitionApp(QMainWindow):
         
         if file_name:
             self.video_path = file_name
+            self.source_name = file_name
+            self.camera_watcher.release_busy(self.camera_index)
+            self.camera_index = None
+            if self.cap:
+                self.cap.release()
             self.log(f"Выбран файл: {file_name}")
             
             # Открываем видео
@@ -335,6 +488,11 @@ class VideoRecognitionApp(QMainWindow):
             self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
             self.progress_bar.setMaximum(self.total_frames)
             
+            # Оцениваем начало записи, его можно уточнить в настройках
+            self.video_fps = self.cap.get(cv2.CAP_PROP_FPS) or 25.0
+            self.recording_start = guess_recording_start(file_name, self.total_frames / self.video_fps)
+            self.log(f"Начало записи: {format_timestamp(self.recording_start)} (можно изменить в настройках)")
+            
             # Активируем кнопки
             self.start_btn.setEnabled(True)
             self.stop_btn.setEnabled(True)
@@ -354,6 +512,9 @@ class VideoRecognitionApp(QMainWindow):
 
     def toggle_processing(self):
         """Переключение режима обработки"""
+        if self.governor is None:
+            QMessageBox.warning(self, "Предупреждение", "Модели еще загружаются")
+            return
         if not self.processing:
             self.processing = True
             self.start_btn.setText("Пауза")
@@ -378,11 +539,37 @@ class VideoRecognitionApp(QMainWindow):
             self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
         self.log("Обработка остановлена")
 
+    def check_camera_changes(self):
+        """Сообщает о подключении и отключении камер, найденных фоновым поиском"""
+        for kind, camera in self.camera_watcher.drain():
+            if kind == 'added':
+                self.log(f"Подключена камера {describe_camera(camera)}")
+            else:
+                self.log(f"Отключена камера {camera['index']}: {camera['name']}")
+
+    def update_governor_label(self):
+        """Показывает текущую нагрузку и решения регулятора"""
+        if self.governor is None:
+            self.governor_label.setText("Регулятор: загрузка моделей...")
+            return
+        self.governor_label.setText(f"Регулятор: {self.governor.describe()} | {self.governor.decision}")
+
+    def show_frame(self, frame):
+        """Выводит кадр в окно превью"""
+        rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        h, w, ch = rgb_image.shape
+        bytes_per_line = ch * w
+        qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
+        
+        # Масштабирование изображения под размер label
+        scaled_pixmap = QPixmap.fromImage(qt_image).scaled(
+            self.video_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation
+        )
+        self.video_label.setPixmap(scaled_pixmap)
+
     def add_unique_number(self, number):
         """Добавление уникального номера в список"""
-        if number not in self.unique_numbers:
-            self.unique_numbers.add(number)
-            self.numbers_list.addItem(number)
+        self.numbers_list.add_number(number)
 
     def update_frame(self):
         """Обновление кадра"""
@@ -391,15 +578,44 @@ class VideoRecognitionApp(QMainWindow):
             
         ret, frame = self.cap.read()
         if not ret:
+            # Камера могла отключиться: ждем переподключения, не останавливая обработку
+            if self.camera_index is not None:
+                if not self.camera_lost:
+                    self.camera_lost = True
+                    self.log(f"Потеря связи с камерой {self.camera_index}, переподключение...")
+                return
             self.stop_processing()
             self.log("Обработка завершена")
             return
             
+        if self.camera_lost:
+            self.camera_lost = False
+            self.log(f"Камера {self.camera_index} снова подключена")
+            
         self.current_frame = frame
         self.frame_count += 1
         self.progress_bar.setValue(self.frame_count)
         
+        # Для видеофайла время события берется из времени кадра, для камеры - текущее
+        if self.recording_start is not None:
+            media_ms = frame_media_ms(self.cap, self.frame_count - 1, self.video_fps)
+            frame_time = self.recording_start + media_ms / 1000
+        else:
+            media_ms = None
+            frame_time = time.time()
+        
+        # Регулятор решает, распознавать ли кадр; пока идут проезды, шаг ограничен
+        decision = self.governor.update(active_tracks=len(self.evidence_writer.open_events))
+        if decision:
+            self.log(f"Регулятор нагрузки: {decision} ({self.governor.describe()})")
+        if not self.governor.should_process(self.frame_count - 1):
+            if self.governor.should_render():
+                self.show_frame(frame)
+            return
+        
         # Обработка кадра
+        found_plates = []
+        recognition_start = time.perf_counter()
         try:
             # Сохраняем кадр во временный файл
             temp_path = f"temp_frame_{self.frame_count}.jpg"
@@ -441,27 +657,49 @@ class VideoRecognitionApp(QMainWindow):
                         # Форматируем номер в латинице для отображения на видео
                         formatted_text_latin = format_plate_number_latin(text)
                         
-                        self.log(f"Найден номер: {formatted_text_cyrillic} (уверенность: {conf:.2f})")
+                        # Сверяем номер с белым и черным списками
+                        match = self.plate_matcher.match(formatted_text_cyrillic)
+                        
+                        self.log(f"Найден номер: {formatted_text_cyrillic} (уверенность: {conf:.2f}) "
+                                 f"{format_match(match)}")
                         self.add_unique_number(formatted_text_cyrillic)
                         
                         # Сохраняем данные о распознанном номере
-                        self.recognized_numbers_data.append({
+                        sighting = {
                             'number': formatted_text_cyrillic,
-                            'confidence': conf,
-                            'timestamp': time.strftime("%Y-%m-%d %H:%M:%S")
-                        })
+                            'confidence': float(conf),
+                            'timestamp': format_timestamp(frame_time),
+                            'ts': frame_time,
+                            'media_ms': media_ms,
+                            'source': self.source_name,
+                            'match': match
+                        }
+                        self.sighting_store.add(sighting)
+                        if self.event_uplink is not None:
+                            self.event_uplink.publish(sighting)
                         
-                        # Рисуем рамку вокруг номера
                         if len(images_bboxs[0]) > i:
                             bbox = images_bboxs[0][i]
-                            cv2.rectangle(frame, 
-                                        (int(bbox[0]), int(bbox[1])), 
-                                        (int(bbox[2]), int(bbox[3])), 
-                                        (0, 255, 0), 2)
-                            cv2.putText(frame, formatted_text_latin, 
-                                      (int(bbox[0]), int(bbox[1]-10)), 
-                                      cv2.FONT_HERSHEY_SIMPLEX, 
-                                      0.9, (0, 255, 0), 2)
+                            found_plates.append((formatted_text_cyrillic, formatted_text_latin, conf, bbox))
+            
+            self.governor.record(time.perf_counter() - recognition_start)
+            
+            # Кадр будет записан, только если он лучший для своего события;
+            # снимки берутся до отрисовки рамок, чтобы в них не было наложений
+            for number, _, conf, bbox in found_plates:
+                self.evidence_writer.offer(number, conf, frame, bbox, frame_time)
+            self.evidence_writer.expire(frame_time)
+            
+            # Рисуем рамки вокруг номеров
+            for _, text_latin, _, bbox in found_plates:
+                cv2.rectangle(frame, 
+                            (int(bbox[0]), int(bbox[1])), 
+                            (int(bbox[2]), int(bbox[3])), 
+                            (0, 255, 0), 2)
+                cv2.putText(frame, text_latin, 
+                          (int(bbox[0]), int(bbox[1]-10)), 
+                          cv2.FONT_HERSHEY_SIMPLEX, 
+                          0.9, (0, 255, 0), 2)
         
         except Exception as e:
             self.log(f"Ошибка при обработке кадра: {str(e)}")
@@ -469,25 +707,34 @@ class VideoRecognitionApp(QMainWindow):
             if os.path.exists(temp_path):
                 os.remove(temp_path)
         
-        # Конвертация кадра для отображения
-        rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        h, w, ch = rgb_image.shape
-        bytes_per_line = ch * w
-        qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-        
-        # Масштабирование изображения под размер label
-        scaled_pixmap = QPixmap.fromImage(qt_image).scaled(
-            self.video_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation
-        )
-        self.video_label.setPixmap(scaled_pixmap)
+        # Кадры с найденными номерами показываем всегда, остальные - с частотой превью
+        if self.governor.should_render(force=bool(found_plates)):
+            self.show_frame(frame)
 
     def closeEvent(self, event):
         """Обработка закрытия приложения"""
         self.stop_processing()
         if self.cap:
             self.cap.release()
+        self.camera_watcher.stop()
+        self.evidence_writer.close()
+        self.sighting_store.close()
+        if self.event_uplink is not None:
+            self.event_uplink.close()
         event.accept()
 
+def format_match(match):
+    """Форматирует результат сверки со списками для лога и отчета"""
+    names = {'allow': 'белый список', 'deny': 'ЧЕРНЫЙ СПИСОК'}
+    if match['list'] is None:
+        return "[нет в списках]"
+    text = f"[{names[match['list']]}"
+    if match['distance']:
+        text += f", похож на {match['matched']}"
+    if match['comment']:
+        text += f", {match['comment']}"
+    return text + "]"
+
 def is_valid_russian_plate(text):
     """Проверяет соответствие номера формату российских номеров"""
     # Разрешенные буквы (кириллица и латиница)
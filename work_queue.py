@@ -0,0 +1,214 @@
+import json
+import os
+import sqlite3
+import time
+
+
+class JobQueue:
+    """Очередь заданий для распределенной обработки архива на SQLite
+
+    Задание - отрезок видео [start_ms, end_ms). Обработчик забирает задание,
+    периодически отмечается (heartbeat) и сдает результат. Задания, по которым
+    давно не было отметок, возвращаются в очередь и достаются другому обработчику.
+    Все операции атомарны, поэтому очередь можно открывать из нескольких процессов.
+    """
+
+    def __init__(self, db_path="reports/jobs.db", heartbeat_timeout=30.0, max_attempts=3):
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.db_path = db_path
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_attempts = max_attempts
+
+        # Транзакции открываются явно (BEGIN IMMEDIATE), чтобы выдача задания была атомарной
+        self.connection = sqlite3.connect(db_path, timeout=30.0, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                batch TEXT NOT NULL,
+                video TEXT NOT NULL,
+                start_ms REAL NOT NULL,
+                end_ms REAL NOT NULL,
+                recording_start REAL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                heartbeat REAL,
+                frames INTEGER,
+                seconds REAL,
+                error TEXT
+            )
+        """)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                job_id INTEGER NOT NULL,
+                media_ms REAL,
+                sighting TEXT NOT NULL
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_results_job ON results (job_id)")
+
+    def _transaction(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+
+    def submit(self, batch, jobs):
+        """Добавляет задания (video, start_ms, end_ms, recording_start) в очередь"""
+        self._transaction()
+        try:
+            self.connection.executemany(
+                "INSERT INTO jobs (batch, video, start_ms, end_ms, recording_start) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(batch, video, start_ms, end_ms, recording_start)
+                 for video, start_ms, end_ms, recording_start in jobs]
+            )
+            self.connection.execute("COMMIT")
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def _requeue_stale(self, now):
+        """Возвращает в очередь задания без отметок дольше heartbeat_timeout"""
+        deadline = now - self.heartbeat_timeout
+        self.connection.execute(
+            "UPDATE jobs SET status = 'failed', error = 'heartbeat timeout' "
+            "WHERE status = 'running' AND heartbeat < ? AND attempts >= ?",
+            (deadline, self.max_attempts)
+        )
+        cursor = self.connection.execute(
+            "UPDATE jobs SET status = 'pending', worker = NULL "
+            "WHERE status = 'running' AND heartbeat < ?",
+            (deadline,)
+        )
+        return cursor.rowcount
+
+    def requeue_stale(self):
+        self._transaction()
+        try:
+            count = self._requeue_stale(time.time())
+            self.connection.execute("COMMIT")
+            return count
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def claim(self, worker):
+        """Выдает обработчику следующее задание или None, если очередь пуста"""
+        now = time.time()
+        self._transaction()
+        try:
+            self._requeue_stale(now)
+            row = self.connection.execute(
+                "SELECT id, batch, video, start_ms, end_ms, recording_start, attempts FROM jobs "
+                "WHERE status = 'pending' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                self.connection.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, heartbeat = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (worker, now, row[0])
+                )
+            self.connection.execute("COMMIT")
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+
+        if row is None:
+            return None
+        job_id, batch, video, start_ms, end_ms, recording_start, attempts = row
+        return {
+            'id': job_id,
+            'batch': batch,
+            'video': video,
+            'start_ms': start_ms,
+            'end_ms': end_ms,
+            'recording_start': recording_start,
+            'attempt': attempts + 1,
+        }
+
+    def heartbeat(self, job_id, worker):
+        """Отмечает, что обработчик жив; False - задание уже передано другому"""
+        cursor = self.connection.execute(
+            "UPDATE jobs SET heartbeat = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time(), job_id, worker)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, worker, sightings, frames=0, seconds=0.0):
+        """Сохраняет результат задания; False - задание уже передано другому"""
+        self._transaction()
+        try:
+            cursor = self.connection.execute(
+                "UPDATE jobs SET status = 'done', frames = ?, seconds = ?, error = NULL "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (frames, seconds, job_id, worker)
+            )
+            if cursor.rowcount != 1:
+                self.connection.execute("ROLLBACK")
+                return False
+            # Повторная сдача того же задания не дублирует записи
+            self.connection.execute("DELETE FROM results WHERE job_id = ?", (job_id,))
+            self.connection.executemany(
+                "INSERT INTO results (job_id, media_ms, sighting) VALUES (?, ?, ?)",
+                [(job_id, sighting.get('media_ms'), json.dumps(sighting, ensure_ascii=False))
+                 for sighting in sightings]
+            )
+            self.connection.execute("COMMIT")
+            return True
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def fail(self, job_id, worker, error):
+        """Возвращает задание в очередь или помечает его неудачным после max_attempts попыток"""
+        self.connection.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "worker = NULL, error = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (self.max_attempts, str(error), job_id, worker)
+        )
+
+    def progress(self, batch):
+        """Количество заданий по состояниям и число обработанных кадров"""
+        counts = {'pending': 0, 'running': 0, 'done': 0, 'failed': 0}
+        rows = self.connection.execute(
+            "SELECT status, COUNT(*) FROM jobs WHERE batch = ? GROUP BY status", (batch,)
+        )
+        for status, count in rows:
+            counts[status] = count
+        frames, seconds = self.connection.execute(
+            "SELECT COALESCE(SUM(frames), 0), COALESCE(SUM(seconds), 0) FROM jobs "
+            "WHERE batch = ? AND status = 'done'", (batch,)
+        ).fetchone()
+        counts['frames'] = frames
+        counts['seconds'] = seconds
+        return counts
+
+    def active(self):
+        """Количество заданий во всей очереди, которые еще ждут или выполняются"""
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')"
+        ).fetchone()[0]
+
+    def failed_jobs(self, batch):
+        rows = self.connection.execute(
+            "SELECT video, start_ms, end_ms, error FROM jobs "
+            "WHERE batch = ? AND status = 'failed' ORDER BY id", (batch,)
+        )
+        return [{'video': video, 'start_ms': start_ms, 'end_ms': end_ms, 'error': error}
+                for video, start_ms, end_ms, error in rows]
+
+    def iter_results(self, batch):
+        """Перебирает записи всех выполненных заданий по видео и времени кадра"""
+        rows = self.connection.execute(
+            "SELECT r.sighting FROM results r JOIN jobs j ON j.id = r.job_id "
+            "WHERE j.batch = ? AND j.status = 'done' ORDER BY j.video, r.media_ms", (batch,)
+        )
+        for (sighting,) in rows:
+            yield json.loads(sighting)
+
+    def close(self):
+        self.connection.close()